@@ -0,0 +1,81 @@
+import numpy as np
+from enum import IntEnum
+
+class BreathSummary:
+    metrics = IntEnum('metrics', ['start_time', 'peak_pressure', 'plateau_pressure', 'tidal_volume',
+                                  'peak_inspiratory_flow', 'peak_expiratory_flow', 'auto_peep', 'ie_ratio'],
+                      module = __name__, qualname = 'BreathSummary.metrics')
+
+    def __init__(self, parameters, phase, peep):
+        self.parameters = parameters
+        self.phase = phase
+        self.peep = peep
+        self.breaths = []
+        self.current = None
+        self.last_phase = None
+
+    def addBlock(self, columns, phases):
+        if len(phases) == 0:
+            return
+
+        inspiratory = phases == self.phase.inspiratory.value
+        previous = np.empty(len(phases), dtype = int)
+        previous[0] = -1 if self.last_phase is None else self.last_phase
+        previous[1:] = phases[:-1]
+        starts = np.flatnonzero(inspiratory & (previous != self.phase.inspiratory.value))
+        self.last_phase = phases[-1]
+
+        offsets = np.union1d([0], starts)
+        segments = self.reduce(columns, phases, offsets)
+        for index in range(len(offsets)):
+            segment = {key: values[index] for key, values in segments.items()}
+            if self.current is not None and index == 0 and (len(starts) == 0 or starts[0] > 0):
+                self.current = self.merge(self.current, segment)
+                continue
+
+            if self.current is not None:
+                self.breaths.append(self.close(self.current))
+            self.current = segment
+
+    def reduce(self, columns, phases, offsets):
+        def column(key):
+            return columns[self.parameters[key] - 1]
+
+        index = np.arange(len(phases))
+        expiratory = phases == self.phase.expiratory.value
+        inspiratory_pause = phases == self.phase.inspiratory_pause.value
+        last_pause = np.maximum.reduceat(np.where(inspiratory_pause, index, -1), offsets)
+        last_expiration = np.maximum.reduceat(np.where(expiratory, index, -1), offsets)
+
+        return {'start_time': column('time')[offsets],
+                'peak_pressure': np.fmax.reduceat(column('pressure'), offsets),
+                'plateau_pressure': np.where(last_pause >= 0, column('p_alv')[last_pause], np.nan),
+                'tidal_volume': np.fmax.reduceat(column('volume'), offsets),
+                'peak_inspiratory_flow': np.fmax.reduceat(np.where(expiratory, np.nan, column('flow')), offsets),
+                'peak_expiratory_flow': np.fmin.reduceat(np.where(expiratory, column('flow'), np.nan), offsets),
+                'end_expiratory_pressure': np.where(last_expiration >= 0, column('p_alv')[last_expiration], np.nan),
+                'inspiratory_steps': np.add.reduceat(~expiratory, offsets),
+                'expiratory_steps': np.add.reduceat(expiratory, offsets)}
+
+    def merge(self, current, segment):
+        return {'start_time': current['start_time'],
+                'peak_pressure': np.fmax(current['peak_pressure'], segment['peak_pressure']),
+                'plateau_pressure': current['plateau_pressure'] if np.isnan(segment['plateau_pressure']) else segment['plateau_pressure'],
+                'tidal_volume': np.fmax(current['tidal_volume'], segment['tidal_volume']),
+                'peak_inspiratory_flow': np.fmax(current['peak_inspiratory_flow'], segment['peak_inspiratory_flow']),
+                'peak_expiratory_flow': np.fmin(current['peak_expiratory_flow'], segment['peak_expiratory_flow']),
+                'end_expiratory_pressure': current['end_expiratory_pressure'] if np.isnan(segment['end_expiratory_pressure']) else segment['end_expiratory_pressure'],
+                'inspiratory_steps': current['inspiratory_steps'] + segment['inspiratory_steps'],
+                'expiratory_steps': current['expiratory_steps'] + segment['expiratory_steps']}
+
+    def close(self, breath):
+        values = dict(breath)
+        values['auto_peep'] = breath['end_expiratory_pressure'] - self.peep
+        values['ie_ratio'] = breath['inspiratory_steps'] / breath['expiratory_steps'] if breath['expiratory_steps'] > 0 else np.nan
+        return [values[metric.name] for metric in self.metrics]
+
+    def table(self):
+        breaths = list(self.breaths)
+        if self.current is not None:
+            breaths.append(self.close(self.current))
+        return np.array(breaths, dtype = float).reshape(-1, len(self.metrics))
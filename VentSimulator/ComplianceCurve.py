@@ -0,0 +1,129 @@
+import numpy as np
+
+class ComplianceCurve:
+    TABLE_SIZE = 4096
+    OVERSAMPLING = 8
+
+    def __init__(self, table_size = TABLE_SIZE):
+        self.table_size = table_size
+        self.compiled = False
+
+    def samples(self):
+        raise NotImplementedError
+
+    def getParameters(self):
+        raise NotImplementedError
+
+    def compile(self):
+        pressures, volumes = (np.asarray(values, dtype = float) for values in self.samples())
+        if np.any(np.diff(pressures) <= 0) or np.any(np.diff(volumes) <= 0):
+            raise ValueError('Compliance curve must be strictly increasing in both pressure and volume')
+
+        volume_grid = np.linspace(volumes[0], volumes[-1], self.table_size)
+        pressure_grid = np.linspace(pressures[0], pressures[-1], self.table_size)
+        self.volume_origin = volume_grid[0]
+        self.volume_scale = (self.table_size - 1) / (volume_grid[-1] - volume_grid[0])
+        self.pressure_table = np.interp(volume_grid, volumes, pressures)
+        self.pressure_origin = pressure_grid[0]
+        self.pressure_scale = (self.table_size - 1) / (pressure_grid[-1] - pressure_grid[0])
+        self.volume_table = np.interp(pressure_grid, pressures, volumes)
+
+        # scalar lookups from the Euler loop are cheaper on plain lists than on numpy arrays
+        self.pressure_list = self.pressure_table.tolist()
+        self.volume_list = self.volume_table.tolist()
+        self.compiled = True
+        return self
+
+    @staticmethod
+    def lookup(value, origin, scale, table, table_list):
+        # linear interpolation between table entries, extrapolating along the end segments
+        position = (value - origin) * scale
+        if isinstance(value, float):
+            index = min(max(int(position), 0), len(table_list) - 2)
+            low = table_list[index]
+            return low + (position - index) * (table_list[index + 1] - low)
+
+        index = np.clip(np.asarray(position).astype(int), 0, len(table) - 2)
+        low = table[index]
+        return low + (position - index) * (table[index + 1] - low)
+
+    def pressure(self, volume):
+        if not self.compiled:
+            self.compile()
+        return self.lookup(volume, self.volume_origin, self.volume_scale, self.pressure_table, self.pressure_list)
+
+    def volume(self, pressure):
+        if not self.compiled:
+            self.compile()
+        return self.lookup(pressure, self.pressure_origin, self.pressure_scale, self.volume_table, self.volume_list)
+
+    def compliance(self, volume):
+        # local slope dV/dP, e.g. for plotting the curve against the linear model
+        step = 1 / self.volume_scale if self.compiled else 1e-6
+        return 2 * step / (self.pressure(volume + step) - self.pressure(volume - step))
+
+class SigmoidCurve(ComplianceCurve):
+    # Venegas et al. (1998): V = a + b / (1 + exp(-(P - c) / d)); the inflection points sit near c -/+ 1.317 d
+    def __init__(self, lower_volume = -0.2, volume_span = 2.2, inflection_pressure = 20, width = 5,
+                 pressure_range = (-10, 60), table_size = ComplianceCurve.TABLE_SIZE):
+        super().__init__(table_size)
+        self.lower_volume = lower_volume
+        self.volume_span = volume_span
+        self.inflection_pressure = inflection_pressure
+        self.width = width
+        self.pressure_range = pressure_range
+
+    @property
+    def lower_inflection(self):
+        return self.inflection_pressure - 1.317 * self.width
+
+    @property
+    def upper_inflection(self):
+        return self.inflection_pressure + 1.317 * self.width
+
+    def samples(self):
+        pressures = np.linspace(*self.pressure_range, self.table_size * self.OVERSAMPLING)
+        volumes = self.lower_volume + self.volume_span / (1 + np.exp(-(pressures - self.inflection_pressure) / self.width))
+        return pressures, volumes
+
+    def getParameters(self):
+        return {'lower_volume': self.lower_volume, 'volume_span': self.volume_span,
+                'inflection_pressure': self.inflection_pressure, 'width': self.width,
+                'pressure_range': self.pressure_range, 'table_size': self.table_size}
+
+class PiecewiseLinearCurve(ComplianceCurve):
+    # one compliance per pressure segment, e.g. (0.02, 0.06, 0.015) with breakpoints at the
+    # lower and upper inflection points; volume is zero at zero pressure
+    def __init__(self, compliances = (0.02, 0.06, 0.015), breakpoints = (8, 28), pressure_range = (-10, 60),
+                 table_size = ComplianceCurve.TABLE_SIZE):
+        super().__init__(table_size)
+        if len(compliances) != len(breakpoints) + 1:
+            raise ValueError('PiecewiseLinearCurve needs one more compliance than breakpoints')
+        self.compliances = tuple(compliances)
+        self.breakpoints = tuple(breakpoints)
+        self.pressure_range = pressure_range
+
+    def samples(self):
+        low, high = self.pressure_range
+        pressures = np.unique(np.clip([low, 0, *self.breakpoints, high], low, high))
+        slopes = np.array(self.compliances)[np.searchsorted(self.breakpoints, pressures[:-1], side = 'right')]
+        volumes = np.concatenate([[0], np.cumsum(slopes * np.diff(pressures))])
+        return pressures, volumes - np.interp(0, pressures, volumes)
+
+    def getParameters(self):
+        return {'compliances': self.compliances, 'breakpoints': self.breakpoints,
+                'pressure_range': self.pressure_range, 'table_size': self.table_size}
+
+class TabulatedCurve(ComplianceCurve):
+    def __init__(self, pressures, volumes, table_size = ComplianceCurve.TABLE_SIZE):
+        super().__init__(table_size)
+        if len(pressures) != len(volumes) or len(pressures) < 2:
+            raise ValueError('TabulatedCurve needs at least two matching pressure and volume points')
+        self.pressures = tuple(float(pressure) for pressure in pressures)
+        self.volumes = tuple(float(volume) for volume in volumes)
+
+    def samples(self):
+        return self.pressures, self.volumes
+
+    def getParameters(self):
+        return {'pressures': self.pressures, 'volumes': self.volumes, 'table_size': self.table_size}
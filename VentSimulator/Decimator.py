@@ -0,0 +1,110 @@
+import numpy as np
+
+class Decimator:
+    methods = ['minmax', 'lttb']
+    POINTS_PER_PIXEL = 2
+    MIN_POINTS = 200
+    PRESELECTION = 4
+
+    def __init__(self, axis, method = 'minmax'):
+        if method not in self.methods:
+            raise ValueError("Unknown decimation method '{}'".format(method))
+
+        self.axis = axis
+        self.method = method
+        self.lines = []
+        self.updating = False
+        axis.callbacks.connect('xlim_changed', self.onZoom)
+
+    @classmethod
+    def forAxis(cls, axis, method = 'minmax'):
+        # matplotlib's callback registry only holds a weak reference to onZoom, so the axis keeps its
+        # decimator alive; plots on the same axis with the same method share it
+        decimators = axis.__dict__.setdefault('decimators', {})
+        if method not in decimators:
+            decimators[method] = cls(axis, method)
+        return decimators[method]
+
+    def budget(self):
+        return max(self.MIN_POINTS, int(self.axis.bbox.width * self.POINTS_PER_PIXEL))
+
+    def plot(self, x, y, **kwargs):
+        x, y = np.asarray(x), np.asarray(y)
+        line = self.axis.plot(*self.decimate(x, y, 0, len(x)), **kwargs)[0]
+        self.lines.append([line, x, y, (0, len(x), self.budget())])
+        return line
+
+    def decimate(self, x, y, start, stop):
+        if stop - start <= self.budget():
+            return x[start:stop], y[start:stop]
+        if self.method == 'lttb':
+            indices = self.lttb(x[start:stop], y[start:stop], self.budget()) + start
+        else:
+            indices = self.minMax(y[start:stop], self.budget()) + start
+        return x[indices], y[indices]
+
+    def onZoom(self, axis):
+        if self.updating:
+            return
+
+        low, high = axis.get_xlim()
+        self.updating = True
+        for entry in self.lines:
+            line, x, y, view = entry
+            # keep one sample beyond each edge so the line runs to the border of the view
+            start = max(np.searchsorted(x, low, side = 'left') - 1, 0)
+            stop = min(np.searchsorted(x, high, side = 'right') + 1, len(x))
+            if view == (start, stop, self.budget()):
+                continue
+            entry[3] = (start, stop, self.budget())
+            line.set_data(*self.decimate(x, y, start, stop))
+        self.updating = False
+        axis.figure.canvas.draw_idle()
+
+    @staticmethod
+    def minMax(y, points):
+        # the minimum and maximum of every bucket, in sample order, so peaks survive at any zoom. NaN samples
+        # are skipped, so a bucket keeps a NaN point only when it holds nothing else
+        buckets = max(points // 2, 1)
+        size = -(-len(y) // buckets)
+        padding = size * buckets - len(y)
+        missing = np.isnan(y)
+        low = np.concatenate([np.where(missing, np.inf, y), np.full(padding, np.inf)]).reshape(buckets, size)
+        high = np.concatenate([np.where(missing, -np.inf, y), np.full(padding, -np.inf)]).reshape(buckets, size)
+        offsets = np.arange(buckets) * size
+        indices = np.sort(np.stack([np.argmin(low, axis = 1), np.argmax(high, axis = 1)], axis = 1), axis = 1)
+        indices = (indices + offsets[:, np.newaxis]).ravel()
+        return np.unique(np.concatenate([[0], indices[indices < len(y)], [len(y) - 1]]))
+
+    @staticmethod
+    def lttb(x, y, points):
+        # Largest-Triangle-Three-Buckets (Steinarsson, 2013); long inputs are first reduced with min-max
+        # buckets (MinMaxLTTB), which keeps the extremes LTTB would pick and shortens the sequential loop
+        if points < 3 or len(x) <= points:
+            return np.arange(len(x))
+
+        candidates = np.arange(len(x))
+        if len(x) > Decimator.PRESELECTION * points:
+            candidates = Decimator.minMax(y, Decimator.PRESELECTION * points)
+        cx, cy = x[candidates], y[candidates]
+
+        edges = np.linspace(1, len(cx) - 1, points - 1).astype(int)
+        present = ~np.isnan(cy[:-1])
+        sums_x = np.add.reduceat(cx[:-1], edges[:-1])
+        sums_y = np.add.reduceat(np.where(present, cy[:-1], 0), edges[:-1])
+        average_x = np.append((sums_x / np.diff(edges))[1:], cx[-1])
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            average_y = np.append((sums_y / np.add.reduceat(present, edges[:-1]))[1:], cy[-1])
+
+        indices = np.empty(points, dtype = int)
+        indices[0], indices[-1] = 0, len(cx) - 1
+        selected = 0
+        for bucket in range(points - 2):
+            start, stop = edges[bucket], edges[bucket + 1]
+            selected_x, selected_y = cx[selected], cy[selected]
+            areas = np.abs((selected_x - average_x[bucket]) * (cy[start:stop] - selected_y)
+                           - (selected_x - cx[start:stop]) * (average_y[bucket] - selected_y))
+            # NaN areas, from gaps in y, lose to any real triangle
+            selected = start + int(np.argmax(np.where(np.isnan(areas), -1, areas)))
+            indices[bucket + 1] = selected
+        return candidates[indices]
@@ -0,0 +1,108 @@
+import numpy as np
+
+class FastForward:
+    MAX_TEMPLATES = 8
+
+    def __init__(self, ventilator, time_length, time_step, tolerance):
+        self.ventilator = ventilator
+        self.time_step = time_step
+        self.tolerance = tolerance
+        self.steps = int(ventilator.stepCount(time_length, time_step))
+        self.templates = {}
+        self.generator = None
+        self.step = 0
+        self.integrated_breaths = 0
+        self.tiled_breaths = 0
+
+    def breathStarts(self, breath_steps):
+        # a breath that is back in expiration by the end of its breath length starts the next one exactly
+        # breath_steps later; integrate() checks that it was
+        if not np.isfinite(breath_steps) or breath_steps < 1:
+            return []
+        return list(range(int(breath_steps), self.steps, int(breath_steps)))
+
+    def statesMatch(self, state, other):
+        return np.max(np.abs(np.subtract(state, other))) <= self.tolerance
+
+    def match(self, start, end, state):
+        for template in self.templates.get(end - start, []):
+            if self.statesMatch(template['start_state'], state):
+                return template
+        return None
+
+    def run(self):
+        ventilator = self.ventilator
+        if self.steps == 0:
+            return
+
+        state = ventilator.patient.getState()
+        start = 0
+        breath_steps = ventilator.stepCount(ventilator.configuration().breath_length, self.time_step)
+        for end in self.breathStarts(breath_steps) + [self.steps]:
+            template = self.match(start, end, state)
+            if template is None:
+                template = self.integrate(start, end, state)
+                if template is None:
+                    return
+                self.integrated_breaths = self.integrated_breaths + 1
+            else:
+                self.tile(template, start, end)
+                self.tiled_breaths = self.tiled_breaths + 1
+            state = template['end_state']
+            start = end
+        ventilator.patient.setState(state)
+
+    def integrate(self, start, end, state):
+        ventilator = self.ventilator
+        if self.generator is None or self.step != start:
+            ventilator.patient.setState(state)
+            self.generator = ventilator.phaseMachine(self.time_step, start)
+            next(self.generator)
+
+        first_row = ventilator.trace.length
+        phases = np.empty(end - start, dtype = int)
+        for row in range(end - start):
+            next(self.generator)
+            phases[row] = ventilator.current_phase.value
+        self.step = end
+
+        if end == self.steps:
+            return {'end_state': ventilator.patient.getState()}
+        if ventilator.current_phase != ventilator.phase.expiratory:
+            # inspiration outlasted the breath length, so the following breaths do not start on the
+            # breath_steps grid
+            self.finish()
+            return None
+
+        template = {'start_state': state, 'end_state': ventilator.patient.getState(), 'phases': phases}
+        if ventilator.recording == 'summary':
+            ventilator.flushSummary()
+            template['breath'] = dict(ventilator.summary.current)
+        else:
+            template['rows'] = ventilator.trace.columns[:, first_row:first_row + end - start].copy()
+
+        templates = self.templates.setdefault(end - start, [])
+        templates.append(template)
+        del templates[:-self.MAX_TEMPLATES]
+        return template
+
+    def finish(self):
+        for row in range(self.step, self.steps):
+            next(self.generator)
+        self.step = self.steps
+
+    def tile(self, template, start, end):
+        ventilator = self.ventilator
+        if ventilator.instrumentation is not None:
+            ventilator.instrumentation.countBlock(template['phases'])
+        if ventilator.recording == 'summary':
+            summary = ventilator.summary
+            if summary.current is not None:
+                summary.breaths.append(summary.close(summary.current))
+            summary.current = dict(template['breath'], start_time = start * self.time_step)
+            summary.last_phase = ventilator.phase.expiratory.value
+            return
+
+        block = ventilator.trace.extend(end - start)
+        ventilator.trace.columns[:, block] = template['rows']
+        ventilator.trace.columns[ventilator.parameters.time - 1, block] = np.arange(start, end) * self.time_step
@@ -0,0 +1,110 @@
+from enum import Enum
+import numpy as np
+
+class FlowProfile:
+    registry = {}
+    CACHE_SIZE = 256
+
+    def __init__(self):
+        self.cache = {}
+
+    @classmethod
+    def register(cls, name, profile):
+        cls.registry[name] = profile
+        return profile
+
+    @classmethod
+    def resolve(cls, pattern):
+        if isinstance(pattern, FlowProfile):
+            return pattern
+        name = pattern.name if isinstance(pattern, Enum) else pattern
+        if name not in cls.registry:
+            raise ValueError("Unknown flow pattern '{}'".format(name))
+        return cls.registry[name]
+
+    def compiled(self, flow, volume_target, rise_time, time_step):
+        # one read-only array per settings combination, shared by every breath and every run that uses it
+        key = (float(flow), float(volume_target), float(rise_time), float(time_step))
+        if key not in self.cache:
+            if len(self.cache) >= self.CACHE_SIZE:
+                self.cache.clear()
+            profile = np.array(self.compile(flow, volume_target, rise_time, time_step), dtype = float)
+            profile.setflags(write = False)
+            self.cache[key] = profile
+        return self.cache[key]
+
+    def compile(self, flow, volume_target, rise_time, time_step):
+        raise NotImplementedError
+
+    def flowAt(self, elapsed, flow, volume_target, rise_time):
+        raise NotImplementedError
+
+class SquareProfile(FlowProfile):
+    def compile(self, flow, volume_target, rise_time, time_step):
+        rise_time_steps = int(np.ceil(rise_time / time_step))
+        rise_time_flow = np.linspace(0, 1, num = rise_time_steps) * flow
+        return np.append(rise_time_flow, flow)
+
+    def flowAt(self, elapsed, flow, volume_target, rise_time):
+        rise = flow * np.clip(elapsed / rise_time, 0, 1) if rise_time > 0 else flow
+        return np.where(elapsed < rise_time, rise, flow)
+
+class DeceleratingProfile(FlowProfile):
+    def compile(self, flow, volume_target, rise_time, time_step):
+        rise_time_steps = int(np.ceil(rise_time / time_step))
+        rise_time_flow = np.linspace(0, 2, num = rise_time_steps) * flow
+        rise_time_volume = np.sum(rise_time_flow * time_step)
+
+        planned_inspiratory_time = (volume_target - rise_time_volume) / flow
+        total_time_steps = int(np.ceil(planned_inspiratory_time / time_step))
+
+        return np.append(rise_time_flow, np.linspace(2, 0, num = total_time_steps) * flow)
+
+    def flowAt(self, elapsed, flow, volume_target, rise_time):
+        peak_flow = 2 * flow
+        planned_inspiratory_time = (volume_target - flow * rise_time) / flow
+        rise = peak_flow * np.clip(elapsed / rise_time, 0, 1) if rise_time > 0 else peak_flow
+        return np.where(elapsed < rise_time, rise,
+                        peak_flow * np.clip(1 - (elapsed - rise_time) / planned_inspiratory_time, 0, 1))
+
+class ShapedProfile(FlowProfile):
+    # a shape over the planned inspiratory time volume_target / flow, scaled so its mean flow is `flow`;
+    # rise_time is part of the shape
+    def shape(self, fraction):
+        raise NotImplementedError
+
+    def compile(self, flow, volume_target, rise_time, time_step):
+        # sampled at step midpoints, then scaled so the steps add up to exactly volume_target
+        if flow <= 0:
+            return [0.0]
+        steps = max(int(np.ceil(volume_target / flow / time_step)), 1)
+        profile = self.shape((np.arange(steps) + 0.5) / steps)
+        return profile * (volume_target / (np.sum(profile) * time_step))
+
+    def flowAt(self, elapsed, flow, volume_target, rise_time):
+        fraction = np.asarray(elapsed) * flow / volume_target
+        return np.where(fraction < 1, self.shape(np.clip(fraction, 0, 1)), self.shape(np.array([1.0]))[0]) * flow
+
+class SinusoidalProfile(ShapedProfile):
+    def shape(self, fraction):
+        # half sine wave with a mean of one
+        return np.pi / 2 * np.sin(np.pi * fraction)
+
+class TabulatedProfile(ShapedProfile):
+    def __init__(self, samples):
+        super().__init__()
+        samples = np.asarray(samples, dtype = float)
+        if len(samples) < 2 or np.any(samples < 0) or np.mean(samples) <= 0:
+            raise ValueError('TabulatedProfile needs at least two non-negative samples with a positive mean')
+        area = (np.sum(samples) - (samples[0] + samples[-1]) / 2) / (len(samples) - 1)
+        self.samples = tuple(float(sample) for sample in samples / area)
+
+    def shape(self, fraction):
+        return np.interp(fraction, np.linspace(0, 1, len(self.samples)), self.samples)
+
+    def __repr__(self):
+        return 'TabulatedProfile({})'.format(self.samples)
+
+FlowProfile.register('square', SquareProfile())
+FlowProfile.register('decelerating', DeceleratingProfile())
+FlowProfile.register('sinusoidal', SinusoidalProfile())
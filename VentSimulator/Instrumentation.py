@@ -0,0 +1,155 @@
+import pstats
+import time
+from collections import Counter
+import numpy as np
+
+class Instrumentation:
+    # wrappers are installed as instance attributes, so an uninstrumented ventilator runs the plain methods
+    ventilator_methods = ['simulate', 'tick', 'record', 'recordBlock', 'recordColumns', 'flushSummary',
+                          'configuration']
+    patient_methods = ['addVolume', 'getPressure']
+    subsystems = {'simulate': 'phase logic', 'stream': 'phase logic', 'configuration': 'configuration',
+                  'tick': 'recording', 'record': 'recording', 'recordBlock': 'recording',
+                  'recordColumns': 'recording', 'flushSummary': 'recording',
+                  'patient.addVolume': 'patient', 'patient.getPressure': 'patient'}
+
+    def __init__(self, ventilator):
+        self.ventilator = ventilator
+        self.breath_callbacks = []
+        self.phase_callbacks = []
+        self.patient = None
+        self.reset()
+
+        for name in self.ventilator_methods:
+            setattr(ventilator, name, self.timed(name, getattr(ventilator, name)))
+        ventilator.tick = self.countingTick(ventilator.tick)
+        ventilator.recordColumns = self.countingBlock(ventilator.recordColumns)
+        ventilator.simulate = self.attachingSimulate(ventilator.simulate)
+        ventilator.stream = self.attachingStream(ventilator.stream)
+
+    def reset(self):
+        self.steps = Counter()
+        self.transitions = Counter()
+        self.breaths = 0
+        self.step_count = 0
+        self.last_phase = None
+        self.timings = {}
+        self.stack = []
+
+    def detach(self):
+        for name in self.ventilator_methods + ['stream']:
+            self.ventilator.__dict__.pop(name, None)
+        self.detachPatient()
+
+    def detachPatient(self):
+        if self.patient is not None:
+            for name in self.patient_methods:
+                self.patient.__dict__.pop(name, None)
+        self.patient = None
+
+    def attachPatient(self):
+        if self.patient is self.ventilator.patient:
+            return
+        self.detachPatient()
+        self.patient = self.ventilator.patient
+        for name in self.patient_methods:
+            setattr(self.patient, name, self.timed('patient.' + name, getattr(self.patient, name)))
+
+    def timed(self, name, function):
+        # exclusive (own) and inclusive time per wrapped call, like the tt and ct columns of cProfile; the
+        # wrappers' own bookkeeping lands in the caller's exclusive time, mostly 'phase logic'
+        clock = time.perf_counter
+        stack = self.stack
+
+        def wrapper(*args, **kwargs):
+            timing = self.timings.setdefault(name, [0, 0.0, 0.0])
+            stack.append(0.0)
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                children = stack.pop()
+                timing[0] = timing[0] + 1
+                timing[1] = timing[1] + elapsed - children
+                timing[2] = timing[2] + elapsed
+                if stack:
+                    stack[-1] = stack[-1] + elapsed
+        return wrapper
+
+    def attachingSimulate(self, simulate):
+        def wrapper(*args, **kwargs):
+            self.attachPatient()
+            self.last_phase = None
+            return simulate(*args, **kwargs)
+        return wrapper
+
+    def attachingStream(self, stream):
+        # a generator: each chunk is timed while the stream produces it, not while the caller consumes it
+        def wrapper(*args, **kwargs):
+            self.attachPatient()
+            self.last_phase = None
+            advance = self.timed('stream', stream(*args, **kwargs).__next__)
+            while True:
+                try:
+                    chunk = advance()
+                except StopIteration:
+                    return
+                yield chunk
+        return wrapper
+
+    def countingTick(self, tick):
+        def wrapper(phase = None):
+            if phase is not None:
+                self.countPhase(phase, 1)
+            return tick(phase)
+        return wrapper
+
+    def countingBlock(self, recordColumns):
+        def wrapper(columns, phases):
+            self.countBlock(phases)
+            return recordColumns(columns, phases)
+        return wrapper
+
+    def countBlock(self, phases):
+        # a block of rows recorded at once, by recordColumns() or by fast-forward tiling a breath
+        phases = np.asarray(phases)
+        starts = np.flatnonzero(np.diff(phases, prepend = -1))
+        for start, stop in zip(starts, np.append(starts[1:], len(phases))):
+            self.countPhase(self.ventilator.phase(int(phases[start])), stop - start)
+
+    def countPhase(self, phase, count):
+        if phase != self.last_phase:
+            if self.last_phase is not None:
+                self.transitions[(self.last_phase.name, phase.name)] += 1
+                for callback in self.phase_callbacks:
+                    callback(self.ventilator, self.step_count, self.last_phase, phase)
+            if phase == self.ventilator.phase.inspiratory:
+                self.breaths = self.breaths + 1
+                for callback in self.breath_callbacks:
+                    callback(self.ventilator, self.step_count, self.breaths)
+            self.last_phase = phase
+        self.steps[phase.name] += int(count)
+        self.step_count = self.step_count + int(count)
+
+    def asDict(self):
+        subsystems = Counter()
+        for name, (calls, own_time, total_time) in self.timings.items():
+            subsystems[self.subsystems[name]] += own_time
+        return {'steps': dict(self.steps),
+                'transitions': {'{} -> {}'.format(*key): count for key, count in self.transitions.items()},
+                'breaths': self.breaths,
+                'subsystems': dict(subsystems),
+                'calls': {name: {'calls': calls, 'own_time': own_time, 'total_time': total_time}
+                          for name, (calls, own_time, total_time) in self.timings.items()}}
+
+    def create_stats(self):
+        # the interface pstats.Stats expects from a profiler
+        self.stats = {('VentSimulator', 0, name): (calls, calls, own_time, total_time, {})
+                      for name, (calls, own_time, total_time) in self.timings.items()}
+
+    def profileStats(self):
+        return pstats.Stats(self)
+
+    def dumpStats(self, path):
+        self.profileStats().dump_stats(path)
@@ -0,0 +1,126 @@
+import numpy as np
+
+class Integrator:
+    SAFETY = 0.9
+    MIN_FACTOR = 0.2
+    MAX_FACTOR = 5
+    order = 1
+
+    def __init__(self, rtol = 1e-6, atol = 1e-9, max_step = np.inf):
+        self.rtol = rtol
+        self.atol = atol
+        self.max_step = max_step
+
+    def errorNorm(self, error, y, y_new):
+        scale = self.atol + self.rtol * np.maximum(np.abs(y), np.abs(y_new))
+        return np.sqrt(np.mean((error / scale) ** 2))
+
+    def initialStep(self, rhs, t, y, f, t_end):
+        scale = self.atol + self.rtol * np.abs(y)
+        d0 = np.sqrt(np.mean((y / scale) ** 2))
+        d1 = np.sqrt(np.mean((f / scale) ** 2))
+        h = 1e-6 if d0 < 1e-5 or d1 < 1e-5 else 0.01 * d0 / d1
+        return min(h, self.max_step, t_end - t)
+
+    def nextStep(self, h, error_norm):
+        if error_norm == 0:
+            return h * self.MAX_FACTOR
+        factor = self.SAFETY * error_norm ** (-1 / (self.order + 1))
+        return h * min(self.MAX_FACTOR, max(self.MIN_FACTOR, factor))
+
+    @staticmethod
+    def interpolate(t_a, y_a, f_a, t_b, y_b, f_b, t):
+        h = t_b - t_a
+        theta = np.reshape((np.asarray(t) - t_a) / h, (-1, 1))
+        h00 = 2 * theta ** 3 - 3 * theta ** 2 + 1
+        h10 = theta ** 3 - 2 * theta ** 2 + theta
+        h01 = -2 * theta ** 3 + 3 * theta ** 2
+        h11 = theta ** 3 - theta ** 2
+        return h00 * y_a + h10 * h * f_a + h01 * y_b + h11 * h * f_b
+
+    def steps(self, rhs, t, y, t_end):
+        raise NotImplementedError
+
+class RK45Integrator(Integrator):
+    # Dormand-Prince 5(4) tableau
+    order = 4
+    C = np.array([0, 1/5, 3/10, 4/5, 8/9, 1])
+    A = [[],
+         [1/5],
+         [3/40, 9/40],
+         [44/45, -56/15, 32/9],
+         [19372/6561, -25360/2187, 64448/6561, -212/729],
+         [9017/3168, -355/33, 46732/5247, 49/176, -5103/18656]]
+    B = np.array([35/384, 0, 500/1113, 125/192, -2187/6784, 11/84])
+    E = np.array([71/57600, 0, -71/16695, 71/1920, -17253/339200, 22/525, -1/40])
+
+    def steps(self, rhs, t, y, t_end):
+        y = np.array(y, dtype = float)
+        f = rhs(t, y)
+        h = self.initialStep(rhs, t, y, f, t_end)
+
+        while t < t_end:
+            h = min(h, self.max_step, t_end - t)
+            k = [f]
+            for c, a in zip(self.C[1:], self.A[1:]):
+                k.append(rhs(t + c * h, y + h * sum(coefficient * stage for coefficient, stage in zip(a, k))))
+            y_new = y + h * sum(b * stage for b, stage in zip(self.B, k))
+            f_new = rhs(t + h, y_new)
+            k.append(f_new)
+
+            error_norm = self.errorNorm(h * sum(e * stage for e, stage in zip(self.E, k)), y, y_new)
+            if error_norm <= 1:
+                yield t, y, f, t + h, y_new, f_new
+                t, y, f = t + h, y_new, f_new
+            h = self.nextStep(h, error_norm)
+
+class ImplicitIntegrator(Integrator):
+    # backward Euler with step doubling; the Richardson-extrapolated result is second order and L-stable. Its
+    # error is estimated against the trapezoidal rule through the same end points, which is of the same order
+    order = 2
+    NEWTON_ITERATIONS = 8
+    NEWTON_TOLERANCE = 1e-12
+
+    def __init__(self, rtol = 1e-4, atol = 1e-7, max_step = np.inf):
+        super().__init__(rtol, atol, max_step)
+
+    @staticmethod
+    def jacobian(rhs, t, y, f):
+        # one finite-difference Jacobian per step serves all three solves of the step
+        jacobian = np.empty((len(y), len(y)))
+        for column in range(len(y)):
+            delta = np.sqrt(np.finfo(float).eps) * max(1, abs(y[column]))
+            shifted = y.copy()
+            shifted[column] = shifted[column] + delta
+            jacobian[:, column] = (rhs(t, shifted) - f) / delta
+        return jacobian
+
+    def backwardEuler(self, rhs, t, y, y_new, h, jacobian):
+        # simplified Newton from the guess y_new
+        system = np.eye(len(y)) - h * jacobian
+        for iteration in range(self.NEWTON_ITERATIONS):
+            correction = np.linalg.solve(system, y_new - y - h * rhs(t + h, y_new))
+            y_new = y_new - correction
+            if np.all(np.abs(correction) <= self.NEWTON_TOLERANCE * (1 + np.abs(y_new))):
+                break
+        return y_new
+
+    def steps(self, rhs, t, y, t_end):
+        y = np.array(y, dtype = float)
+        f = rhs(t, y)
+        h = self.initialStep(rhs, t, y, f, t_end)
+
+        while t < t_end:
+            h = min(h, self.max_step, t_end - t)
+            jacobian = self.jacobian(rhs, t, y, f)
+            y_full = self.backwardEuler(rhs, t, y, y + h * f, h, jacobian)
+            y_half = self.backwardEuler(rhs, t, y, y + h / 2 * f, h / 2, jacobian)
+            y_half = self.backwardEuler(rhs, t + h / 2, y_half, 2 * y_half - y, h / 2, jacobian)
+            y_new = 2 * y_half - y_full
+            f_new = rhs(t + h, y_new)
+
+            error_norm = self.errorNorm(y_new - y - h / 2 * (f + f_new), y, y_new)
+            if error_norm <= 1:
+                yield t, y, f, t + h, y_new, f_new
+                t, y, f = t + h, y_new, f_new
+            h = self.nextStep(h, error_norm)
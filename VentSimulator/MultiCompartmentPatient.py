@@ -0,0 +1,107 @@
+import numpy as np
+
+class MultiCompartmentPatient:
+    def __init__(self, resistances = [10], compliances = [0.05], airway_resistance = 0):
+        self.compliances = np.array(compliances, dtype = float)
+        self.resistances = np.array(resistances, dtype = float)
+        self.airway_resistance = airway_resistance
+        self.volumes = np.zeros(len(self.compliances))
+        self.time_step = None
+        self.exchange = None
+        self.compliance_curve = None
+        self.effort = None
+        self.ventilator = None
+
+    @property
+    def resistances(self):
+        return self._resistances
+
+    @resistances.setter
+    def resistances(self, resistances):
+        self._resistances = np.broadcast_to(np.array(resistances, dtype = float), self.compliances.shape).copy()
+        self.conductances = 1 / self._resistances
+        self.total_conductance = np.sum(self.conductances)
+
+    @property
+    def resistance(self):
+        return self.airway_resistance + 1 / self.total_conductance
+
+    @resistance.setter
+    def resistance(self, resistance):
+        scale = resistance / self.resistance
+        self.airway_resistance = self.airway_resistance * scale
+        self.resistances = self.resistances * scale
+
+    @property
+    def compliance(self):
+        return np.sum(self.compliances)
+
+    @compliance.setter
+    def compliance(self, compliance):
+        self.compliances = self.compliances * (compliance / self.compliance)
+
+    @property
+    def volume(self):
+        return np.sum(self.volumes)
+
+    @volume.setter
+    def volume(self, volume):
+        self.volumes = self.compliances * (volume / self.compliance)
+
+    def setTimeStep(self, time_step):
+        self.time_step = time_step
+
+    def setPeepHint(self, peep):
+        self.volumes = self.compliances * peep
+
+    def getParameters(self):
+        parameters = {'resistances': self.resistances.tolist(),
+                      'compliances': self.compliances.tolist(),
+                      'airway_resistance': self.airway_resistance}
+        if self.effort is not None:
+            parameters['effort'] = sorted(self.effort.getParameters().items())
+        return parameters
+
+    def setEffort(self, effort):
+        self.effort = effort
+
+    def getState(self):
+        return self.volumes.copy()
+
+    def setState(self, state):
+        self.volumes = np.array(state, dtype = float)
+
+    def getCompartmentPressures(self):
+        return self.volumes / self.compliances
+
+    def exchangeMatrix(self):
+        # compartments exchange gas (pendelluft) through their resistances, dV/dt = (g g^T / G - diag(g)) P,
+        # which relaxes them toward the compliance-weighted mean pressure at which they are balanced. Its
+        # propagator over one time step is found from the symmetric form scaled by sqrt(C), so the exchange is
+        # integrated exactly and stays stable however small R * C is against the time step
+        key = (self.time_step, self.airway_resistance, self._resistances, self.compliances)
+        if self.exchange is None or any(a is not b for a, b in zip(self.exchange[0], key)):
+            # the delivered volume is still split explicitly, and the step loop's flow reads the pressure it
+            # leaves behind, which overshoots once the volume a step moves through the patient's resistance
+            # raises the pressure more than twice the difference that drove it
+            shares = self.conductances / self.total_conductance
+            limit = 2 * self.resistance / np.sum(shares ** 2 / self.compliances)
+            if self.time_step >= limit:
+                raise ValueError("Time step '{}' is past this patient's stability limit '{}'".format(self.time_step, limit))
+            scale = np.sqrt(self.compliances)
+            coupling = np.outer(self.conductances, self.conductances) / self.total_conductance - np.diag(self.conductances)
+            rates, vectors = np.linalg.eigh(coupling / np.outer(scale, scale))
+            propagator = (scale[:, None] * vectors * np.exp(rates * self.time_step)) @ (vectors.T / scale[None, :])
+            self.exchange = (key, propagator)
+        return self.exchange[1]
+
+    def addVolume(self, deltaVolume):
+        # split the delivered volume by conductance, after the compartments exchange gas over the time step;
+        # the exchange leaves the balanced share of the volume alone and relaxes the rest
+        if self.time_step is not None:
+            balanced = self.compliances * (np.sum(self.volumes) / self.compliance)
+            self.volumes = balanced + self.exchangeMatrix() @ (self.volumes - balanced)
+        self.volumes = self.volumes + deltaVolume * self.conductances / self.total_conductance
+
+    def getPressure(self):
+        return np.dot(self.volumes / self.compliances, self.conductances) / self.total_conductance
@@ -0,0 +1,67 @@
+import numpy as np
+
+class MuscleEffort:
+    # spontaneous breathing as a muscle pressure Pmus(t) in cmH2O, positive while the inspiratory muscles
+    # pull; it lowers alveolar pressure by Pmus. An effort starts every 60 / rate seconds after onset
+    shapes = ['parabolic', 'sinusoidal']
+    BLOCK_LENGTH = 4096
+
+    def __init__(self, rate = 15, amplitude = 5, inspiratory_time = 1.0, shape = 'parabolic', relaxation_time = 0.2,
+                 onset = 0):
+        if shape not in self.shapes:
+            raise ValueError("Unknown effort shape '{}'".format(shape))
+        if rate <= 0 or inspiratory_time <= 0 or relaxation_time <= 0:
+            raise ValueError('MuscleEffort needs a positive rate, inspiratory time and relaxation time')
+        if inspiratory_time >= 60 / rate:
+            raise ValueError('MuscleEffort inspiratory time must be shorter than the effort period')
+        self.rate = rate
+        self.amplitude = amplitude
+        self.inspiratory_time = inspiratory_time
+        self.shape = shape
+        self.relaxation_time = relaxation_time
+        self.onset = onset
+
+    @property
+    def period(self):
+        return 60 / self.rate
+
+    def getParameters(self):
+        return {'rate': self.rate, 'amplitude': self.amplitude, 'inspiratory_time': self.inspiratory_time,
+                'shape': self.shape, 'relaxation_time': self.relaxation_time, 'onset': self.onset}
+
+    def __repr__(self):
+        return 'MuscleEffort({})'.format(', '.join('{} = {!r}'.format(*item) for item in self.getParameters().items()))
+
+    def pressureAt(self, time):
+        time = np.asarray(time, dtype = float)
+        elapsed = np.mod(time - self.onset, self.period)
+        fraction = elapsed / self.inspiratory_time
+        if self.shape == 'sinusoidal':
+            pressure = np.where(fraction < 1, self.amplitude * np.sin(np.pi * np.minimum(fraction, 1)), 0.0)
+        else:
+            # parabolic rise to the peak at the end of neural inspiration, then exponential relaxation
+            pressure = np.where(fraction < 1, self.amplitude * fraction * (2 - fraction),
+                                self.amplitude * np.exp(-(elapsed - self.inspiratory_time) / self.relaxation_time))
+        return np.where(time < self.onset, 0.0, pressure)
+
+    def activeAt(self, time):
+        # inside neural inspiration
+        time = np.asarray(time, dtype = float)
+        return (time >= self.onset) & (np.mod(time - self.onset, self.period) < self.inspiratory_time)
+
+    def samples(self, start_step, count, time_step):
+        # a block of the run's waveform, one value per step
+        return self.pressureAt(np.arange(start_step, start_step + count) * time_step)
+
+    @classmethod
+    def batchSamples(cls, efforts, start_step, count, time_step):
+        # one row per configuration, each distinct effort computed once; no effort is zero pressure
+        block = np.zeros((len(efforts), count))
+        computed = {}
+        for index, effort in enumerate(efforts):
+            if effort is None:
+                continue
+            if id(effort) not in computed:
+                computed[id(effort)] = effort.samples(start_step, count, time_step)
+            block[index] = computed[id(effort)]
+        return block
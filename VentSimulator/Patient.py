@@ -3,13 +3,49 @@ class Patient:
         self.volume = 0
         self.compliance = 0.05
         self.resistance = 10
+        self.compliance_curve = None
+        self.effort = None
         self.ventilator = None
         
+    def setTimeStep(self, time_step):
+        pass
+
+    def getParameters(self):
+        parameters = {'resistance': self.resistance, 'compliance': self.compliance}
+        if self.compliance_curve is not None:
+            parameters['compliance_curve'] = [type(self.compliance_curve).__name__,
+                                              sorted(self.compliance_curve.getParameters().items())]
+        if self.effort is not None:
+            parameters['effort'] = sorted(self.effort.getParameters().items())
+        return parameters
+
+    def getState(self):
+        return self.volume
+
+    def setState(self, state):
+        self.volume = state
+
+    def setComplianceCurve(self, compliance_curve):
+        self.compliance_curve = None if compliance_curve is None else compliance_curve.compile()
+
+    def setEffort(self, effort):
+        self.effort = effort
+
     def setPeepHint(self, peep):
+        if self.compliance_curve is not None:
+            self.volume = self.compliance_curve.volume(float(peep))
+            return
         self.volume = self.compliance * peep
         
     def addVolume(self, deltaVolume):
         self.volume = self.volume + deltaVolume
         
     def getPressure(self):
-        return self.volume / self.compliance
\ No newline at end of file
+        if self.compliance_curve is not None:
+            return self.compliance_curve.pressure(self.volume)
+        return self.volume / self.compliance
+
+    def pressureAt(self, volume):
+        if self.compliance_curve is not None:
+            return self.compliance_curve.pressure(volume)
+        return volume / self.compliance
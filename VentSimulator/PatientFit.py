@@ -0,0 +1,172 @@
+import multiprocessing
+import numpy as np
+from VentSimulator.Patient import Patient
+
+def fitChunk(task):
+    patient_fit, recordings = task
+    return patient_fit.fitBatch(recordings)
+
+class PatientFit:
+    # fits a single-compartment Patient's resistance and compliance to recorded flow and pressure. A linear
+    # least-squares fit of the equation of motion seeds a Levenberg-Marquardt refinement in log R and log C,
+    # whose residuals come from simulate_batch: every recording of a chunk, with its finite-difference and
+    # candidate parameters, is simulated in one batch
+    DIFFERENCE_STEP = 1e-4
+    DAMPING_FACTORS = np.array([1, 10, 100])
+    INITIAL_DAMPING = 1e-3
+    MAX_DAMPING = 1e10
+
+    def __init__(self, ventilator_class, max_iterations = 20, tolerance = 1e-6, chunk_size = 128, processes = None):
+        self.ventilator_class = ventilator_class
+        self.max_iterations = max_iterations
+        self.tolerance = tolerance
+        self.chunk_size = chunk_size
+        self.processes = processes
+
+    @staticmethod
+    def recording(flow, pressure, settings = None, time_step = 0.02):
+        # samples at 0, time_step, 2 * time_step, ... from the start of a breath, with the patient at PEEP;
+        # the layout of a ventilator's output without its first row
+        flow = np.asarray(flow, dtype = float)
+        pressure = np.asarray(pressure, dtype = float)
+        if flow.shape != pressure.shape or flow.ndim != 1:
+            raise ValueError('Recorded flow and pressure must be one-dimensional and of equal length')
+        if not (np.isfinite(flow).all() and np.isfinite(pressure).all()):
+            raise ValueError('Recorded flow and pressure must be finite')
+        return {'flow': flow, 'pressure': pressure, 'settings': dict(settings or {}), 'time_step': time_step}
+
+    def traceRecording(self, trace):
+        if trace.ventilator != self.ventilator_class.__name__:
+            raise ValueError("Trace of a {} cannot be fitted with a {}".format(trace.ventilator,
+                                                                             self.ventilator_class.__name__))
+        return self.recording(trace.column('flow', 1), trace.column('pressure', 1), trace.settings, trace.time_step)
+
+    @staticmethod
+    def equationOfMotion(flow, pressure, time_step):
+        # P = R * flow + V / C + P0 over every sample, with V the volume delivered before the sample, as the
+        # step loop's flow laws see it. A fit without a positive R and C falls back to the Patient defaults
+        volume = np.concatenate([[0], np.cumsum(flow[:-1])]) * time_step
+        design = np.column_stack([flow, volume, np.ones(len(flow))])
+        (resistance, elastance, p0), *rest = np.linalg.lstsq(design, pressure, rcond = None)
+        patient = Patient()
+        return (resistance if resistance > 0 else patient.resistance,
+                1 / elastance if elastance > 0 else patient.compliance)
+
+    def batchSettings(self, recordings):
+        # each recording's settings as one array per setting, missing ones at the mode's defaults
+        defaults = self.ventilator_class(Patient()).resolvedSettings()
+        for recording in recordings:
+            for key in recording['settings']:
+                if key not in self.ventilator_class.settings.__members__:
+                    raise ValueError("Unknown setting '{}'".format(key))
+
+        settings = {}
+        for key in defaults:
+            values = [recording['settings'].get(key, defaults[key]) for recording in recordings]
+            if key == 'flow_pattern':
+                values = [self.ventilator_class.flow_patterns[value] if isinstance(value, str) else value
+                          for value in values]
+            settings[key] = np.array(values, dtype = object if key == 'flow_pattern' else None)
+        return settings
+
+    def fit(self, recordings):
+        recordings = list(recordings)
+        groups = {}
+        for index, recording in enumerate(recordings):
+            groups.setdefault(recording['time_step'], []).append(index)
+        chunks = [indices[start:start + self.chunk_size] for indices in groups.values()
+                  for start in range(0, len(indices), self.chunk_size)]
+        tasks = [(self, [recordings[index] for index in chunk]) for chunk in chunks]
+
+        if self.processes == 1:
+            results = [fitChunk(task) for task in tasks]
+        else:
+            with multiprocessing.Pool(self.processes) as pool:
+                results = pool.map(fitChunk, tasks)
+
+        # rms_error is in units of each recording's standard deviation of flow and pressure
+        fitted = {key: np.full(len(recordings), np.nan) for key in
+                  ['resistance', 'compliance', 'initial_resistance', 'initial_compliance', 'rms_error']}
+        fitted['iterations'] = np.zeros(len(recordings), dtype = int)
+        for chunk, result in zip(chunks, results):
+            for key in fitted:
+                fitted[key][chunk] = result[key]
+        return fitted
+
+    def fitBatch(self, recordings):
+        # recordings sharing a time step; shorter ones are padded with zero-weight samples
+        time_step = recordings[0]['time_step']
+        count = len(recordings)
+        length = max(len(recording['flow']) for recording in recordings)
+        observed = np.zeros((count, 2, length))
+        weights = np.zeros((count, 1, length))
+        scales = np.ones((count, 2, 1))
+        for index, recording in enumerate(recordings):
+            samples = len(recording['flow'])
+            for channel, key in enumerate(['flow', 'pressure']):
+                spread = np.std(recording[key])
+                scales[index, channel] = spread if spread > 0 else 1
+                observed[index, channel, :samples] = recording[key] / scales[index, channel]
+            weights[index, :, :samples] = 1
+        settings = self.batchSettings(recordings)
+        parameters = self.ventilator_class.parameters
+
+        def costs(owners, theta):
+            output = self.ventilator_class.simulate_batch(length * time_step, time_step,
+                                                          resistance = np.exp(theta[:, 0]),
+                                                          compliance = np.exp(theta[:, 1]),
+                                                          **{key: value[owners] for key, value in settings.items()})
+            simulated = output[:, 1:, [parameters.flow - 1, parameters.pressure - 1]]
+            residual = (simulated.transpose(0, 2, 1) / scales[owners] - observed[owners]) * weights[owners]
+            return residual.reshape(len(owners), -1)
+
+        seeds = np.array([self.equationOfMotion(recording['flow'], recording['pressure'], time_step)
+                          for recording in recordings])
+        theta = np.log(seeds)
+        cost = np.full(count, np.nan)
+        damping = np.full(count, self.INITIAL_DAMPING)
+        iterations = np.zeros(count, dtype = int)
+        active = np.ones(count, dtype = bool)
+        offsets = np.array([[0, 0], [self.DIFFERENCE_STEP, 0], [0, self.DIFFERENCE_STEP]])
+
+        for iteration in range(self.max_iterations):
+            index = np.flatnonzero(active)
+            if len(index) == 0:
+                break
+            iterations[index] = iterations[index] + 1
+
+            # residuals at theta and one step along log R and log C give the Jacobian
+            residual = costs(index.repeat(3), (theta[index, None, :] + offsets).reshape(-1, 2))
+            residual = residual.reshape(len(index), 3, -1)
+            jacobian = (residual[:, 1:] - residual[:, :1]) / self.DIFFERENCE_STEP
+            cost[index] = np.einsum('km,km->k', residual[:, 0], residual[:, 0])
+            gradient = np.einsum('kpm,km->kp', jacobian, residual[:, 0])
+            hessian = np.einsum('kpm,kqm->kpq', jacobian, jacobian)
+
+            # one candidate per damping, all simulated in the next batch
+            dampings = damping[index, None] * self.DAMPING_FACTORS
+            scaled = dampings[:, :, None] * (hessian.diagonal(axis1 = 1, axis2 = 2)[:, None, :] + 1e-12)
+            system = hessian[:, None] + scaled[..., None] * np.eye(2)
+            steps = -np.linalg.solve(system, np.broadcast_to(gradient[:, None, :, None], system.shape[:-1] + (1,)))[..., 0]
+            candidates = theta[index, None, :] + steps
+            candidate_cost = np.square(costs(index.repeat(len(self.DAMPING_FACTORS)),
+                                             candidates.reshape(-1, 2))).sum(axis = 1).reshape(len(index), -1)
+
+            best = np.argmin(candidate_cost, axis = 1)
+            rows = np.arange(len(index))
+            improved = candidate_cost[rows, best] < cost[index]
+            accepted = index[improved]
+            theta[accepted] = candidates[rows, best][improved]
+            cost[accepted] = candidate_cost[rows, best][improved]
+            damping[accepted] = dampings[rows, best][improved] / 10
+            rejected = index[~improved]
+            damping[rejected] = damping[rejected] * 1000
+
+            small_step = np.abs(steps[rows, best]).max(axis = 1) < self.tolerance
+            active[index[small_step]] = False
+            active[damping > self.MAX_DAMPING] = False
+
+        samples = weights.sum(axis = (1, 2)) * 2
+        return {'resistance': np.exp(theta[:, 0]), 'compliance': np.exp(theta[:, 1]),
+                'initial_resistance': seeds[:, 0], 'initial_compliance': seeds[:, 1],
+                'rms_error': np.sqrt(cost / samples), 'iterations': iterations}
@@ -0,0 +1,42 @@
+import numpy as np
+
+class PhaseLaw:
+    # one row of a mode's phase table. flow(elapsed, p_alv) and pressure(flow, p_alv) work on scalars for the
+    # step loop and on arrays for the adaptive integrators and the batch loop; cycle(time, phase_start,
+    # breath_start, breath_volume, flow, peak_flow) turns positive when the phase ends. flow_samples, when given,
+    # is the flow of each time step of the phase, read in place of flow() by the step loop; a batch table holds
+    # one row of samples per configuration. A timed phase gives its length in steps, counted from the start of
+    # the phase or of the breath, and the step loop ends it on that step instead of calling cycle().
+    # trigger(flow, p_alv), when given, also ends the phase once positive: a patient-triggered breath.
+    # target_pressure, when given, is the pressure the phase drives alveolar pressure toward through the
+    # patient's resistance, so the phase has a closed form for analytic runs; a phase without one and without
+    # flow holds its volume. cycle_time(time_constant, flow), when given, is the closed form of cycle(): the
+    # time from the start of the phase, with flow its flow at that start, to its end
+    __slots__ = ['flow', 'pressure', 'cycle', 'next_phase', 'flow_samples', 'phase_steps', 'breath_steps', 'trigger',
+                 'target_pressure', 'cycle_time']
+
+    def __init__(self, flow, pressure, cycle, next_phase, flow_samples = None, phase_steps = None, breath_steps = None,
+                 trigger = None, target_pressure = None, cycle_time = None):
+        self.flow = flow
+        self.pressure = pressure
+        self.cycle = cycle
+        self.next_phase = next_phase
+        self.flow_samples = flow_samples
+        self.phase_steps = phase_steps
+        self.breath_steps = breath_steps
+        self.trigger = trigger
+        self.target_pressure = target_pressure
+        self.cycle_time = cycle_time
+
+    def end(self, phase_start, breath_start):
+        if self.phase_steps is not None:
+            return phase_start + self.phase_steps
+        if self.breath_steps is not None:
+            return breath_start + self.breath_steps
+        return None
+
+    @staticmethod
+    def constant(value, like):
+        # a law's constant value, shaped like the p_alv it was called with: a plain number for the step loop,
+        # an array for the adaptive and batch paths
+        return np.broadcast_to(value, like.shape) if isinstance(like, np.ndarray) else value
@@ -1,63 +1,41 @@
 import numpy as np
-import matplotlib.pyplot as plt
 from VentSimulator.Ventilator import Ventilator
+from VentSimulator.PhaseLaw import PhaseLaw
 
 class PressureSupportVentilator(Ventilator):
     mode_defaults = {Ventilator.settings.pressure_target: 20, 
                      Ventilator.settings.flow_trigger: 0.25}
+    methods = ['euler', 'analytic', 'rk45', 'implicit']
+    records_peak_flow = True
     
     def __init__(self, patient = None):
         super().__init__(patient)
     
-    def simulate(self, time_length = 60, time_step = 0.02):
-        super().simulate(time_length, time_step)
-
-        phase = self.phase.inspiratory
-        current_time = 0
-        current_volume = 0
-        last_breath_start = 0      
-        peak_flow = 0
-
-        while current_time < time_length:
-            self.tick()
-            self.record({'time': current_time})
-
-            if phase == self.phase.inspiratory:
-                
-                current_flow = (((self['pressure_target'] + self['peep']) - self.patient.getPressure()) / self.patient.resistance)
-
-                if current_flow > peak_flow:
-                    peak_flow = current_flow
-
-                delta_volume = current_flow * time_step
-                self.patient.addVolume(delta_volume)
-                current_volume = current_volume + delta_volume
-                
-                if current_flow < (peak_flow * self['flow_trigger']):
-                    phase = self.phase.expiratory
-                
-                self.record({'flow': current_flow,
-                             'volume': current_volume,
-                             'pressure': self['pressure_target'] + self['peep'],
-                             'p_alv': self.patient.getPressure(),
-                             'peak_flow': peak_flow})
-            else:
-                current_flow = -1 * ((self.patient.getPressure() - self['peep']) / self.patient.resistance)
-                delta_volume = current_flow * time_step
-                self.patient.addVolume(delta_volume)
-                current_volume = current_volume + delta_volume
-                
-                self.record({'flow': current_flow,
-                             'volume': current_volume,
-                             'pressure': self['peep'],
-                             'p_alv': self.patient.getPressure()}) 
-                
-                if self['respiratory_rate'] > 0 and ((current_time - last_breath_start) > (60 / self['respiratory_rate'])):
-                    phase = self.phase.inspiratory
-                    current_volume = 0
-                    peak_flow = 0
-                    last_breath_start = current_time
-            current_time = current_time + time_step
+    def phaseLaws(self, config, time_step):
+        laws = super().phaseLaws(config, time_step)
+        inspiratory_pressure = config.inspiratory_pressure
+        flow_trigger = config.flow_trigger
+        laws[self.phase.inspiratory] = PhaseLaw(
+            lambda elapsed, p_alv: (inspiratory_pressure - p_alv) / self.patient.resistance,
+            lambda flow, p_alv: PhaseLaw.constant(inspiratory_pressure, p_alv),
+            lambda time, phase_start, breath_start, breath_volume, flow, peak_flow:
+                peak_flow * flow_trigger - flow,
+            self.phase.expiratory,
+            target_pressure = inspiratory_pressure,
+            cycle_time = self.cycleTime(flow_trigger))
+        return laws
+
+    @staticmethod
+    def cycleTime(flow_trigger):
+        # inspiratory flow decays as peak * exp(-t / RC), so the cycling point is known. A breath that starts
+        # without inspiratory flow cycles at once; without a flow trigger, inspiration never cycles
+        def cycle_time(time_constant, flow):
+            if flow <= 0 or flow_trigger >= 1:
+                return 0
+            if flow_trigger <= 0:
+                return np.inf
+            return -time_constant * np.log(flow_trigger)
+        return cycle_time
 
     def interactive_shim(self, pressure_target, flow_trigger, peep, respiratory_rate, 
         inspiratory_pause, resistance, compliance):
@@ -69,26 +47,19 @@ class PressureSupportVentilator(Ventilator):
         self.patient.resistance = resistance
         self.patient.compliance = compliance
 
-        self.simulate(12)
+        self.cachedSimulate(12)
 
-        f, (ax1,ax2,ax3) = plt.subplots(3,1,figsize=(12, 12))
-        ax1.set_ylim(0,50)
-        self.plot(['pressure', 'p_alv'], ax1)
-        self.plot('flow', ax2, scalefactor = 60)
-        ax2.set_ylim(-120, 120)
-        self.plot('volume', ax3, scalefactor = 1000)
-        ax3.set_ylim(0, 1000)
+        self.waveformFigure().update(self)
 
     def interact(self):
         import ipywidgets as widgets
-        import IPython.display
 
         pressure_target_widget = widgets.IntSlider(
             value = self['pressure_target'],
             min = 1,
             max = 40,
             step = 1,
-            continuous_update = False,
+            continuous_update = True,
             description = "PC")
 
         flow_trigger_widget = widgets.FloatSlider(
@@ -96,7 +67,7 @@ class PressureSupportVentilator(Ventilator):
             min = 0,
             max = 1,
             step = 0.05,
-            continuous_update = False,
+            continuous_update = True,
             description = "Trigger"
         )
 
@@ -105,7 +76,7 @@ class PressureSupportVentilator(Ventilator):
             min = 0,
             max = 20,
             step = 1,
-            continuous_update = False,
+            continuous_update = True,
             description = "PEEP"
         )
 
@@ -115,7 +86,7 @@ class PressureSupportVentilator(Ventilator):
             min = 0,
             max = 60,
             step = 1,
-            continuous_update = False,
+            continuous_update = True,
             description = "RR"
         )
 
@@ -124,7 +95,7 @@ class PressureSupportVentilator(Ventilator):
             min = 1, 
             max = 50,
             step = 1,
-            continuous_update = False,
+            continuous_update = True,
             description = "Resistance"
         )
 
@@ -134,7 +105,7 @@ class PressureSupportVentilator(Ventilator):
             max = -1,
             base = 10, 
             step = 0.01,
-            continuous_update = False,
+            continuous_update = True,
             description = "Compliance"
         )
 
@@ -142,13 +113,11 @@ class PressureSupportVentilator(Ventilator):
         patient_ui = widgets.VBox([resistance_widget, compliance_widget])
         ui = widgets.HBox([vent_ui, patient_ui])
 
-        output = widgets.interactive_output(self.interactive_shim, 
+        return self.interactWith(ui,
         {'pressure_target': pressure_target_widget,
             'peep': peep_widget,
             'flow_trigger': flow_trigger_widget,
             'respiratory_rate': respiratory_rate_widget,
             'inspiratory_pause': widgets.fixed(0),
             'resistance': resistance_widget,
-            'compliance': compliance_widget})
-
-        return IPython.display.display(ui, output)
\ No newline at end of file
+            'compliance': compliance_widget})
\ No newline at end of file
@@ -1,66 +1,29 @@
 import numpy as np
-import matplotlib.pyplot as plt
 from VentSimulator.Ventilator import Ventilator
+from VentSimulator.PhaseLaw import PhaseLaw
 
 class PressureVentilator(Ventilator):
     mode_defaults = {Ventilator.settings.pressure_target: 20, 
                      Ventilator.settings.inspiratory_time: 0.8}
+    methods = ['euler', 'analytic', 'rk45', 'implicit']
     
     def __init__(self, patient = None):
         super().__init__(patient)
     
-    def simulate(self, time_length = 60, time_step = 0.02):
-        super().simulate(time_length, time_step)
+    def phaseLaws(self, config, time_step):
+        laws = super().phaseLaws(config, time_step)
+        inspiratory_pressure = config.inspiratory_pressure
+        inspiratory_time = config.inspiratory_time
+        laws[self.phase.inspiratory] = PhaseLaw(
+            lambda elapsed, p_alv: (inspiratory_pressure - p_alv) / self.patient.resistance,
+            lambda flow, p_alv: PhaseLaw.constant(inspiratory_pressure, p_alv),
+            lambda time, phase_start, breath_start, breath_volume, flow, peak_flow:
+                (time - breath_start) - inspiratory_time,
+            self.afterInspiration(config),
+            phase_steps = self.phaseSteps(inspiratory_time, time_step),
+            target_pressure = inspiratory_pressure)
+        return laws
 
-        phase = self.phase.inspiratory
-        current_time = 0
-        current_volume = 0
-        last_breath_start = 0      
-
-        while current_time < time_length:
-            self.tick()
-            self.record({'time': current_time})
-
-            if phase == self.phase.inspiratory:
-                current_flow = (((self['pressure_target'] + self['peep']) - self.patient.getPressure()) / self.patient.resistance)
-                delta_volume = current_flow * time_step
-                self.patient.addVolume(delta_volume)
-                current_volume = current_volume + delta_volume
-                
-                if (current_time - last_breath_start) > self['inspiratory_time']:
-                    if self['inspiratory_pause'] > 0:
-                        phase = self.phase.inspiratory_pause
-                        last_pause_start = current_time
-                    else:
-                        phase = self.phase.expiratory
-                
-                self.record({'flow': current_flow,
-                             'volume': current_volume,
-                             'pressure': self['pressure_target'] + self['peep'],
-                             'p_alv': self.patient.getPressure()})
-            elif phase == self.phase.inspiratory_pause:
-                self.record({'flow': 0,
-                             'volume': current_volume,
-                             'pressure':self.patient.getPressure(),
-                             'p_alv': self.patient.getPressure()})
-                if current_time > last_pause_start + self['inspiratory_pause']:
-                    phase = self.phase.expiratory
-            else:
-                current_flow = -1 * ((self.patient.getPressure() - self['peep']) / self.patient.resistance)
-                delta_volume = current_flow * time_step
-                self.patient.addVolume(delta_volume)
-                current_volume = current_volume + delta_volume
-                
-                self.record({'flow': current_flow,
-                             'volume': current_volume,
-                             'pressure': self['peep'],
-                             'p_alv': self.patient.getPressure()}) 
-                
-                if self['respiratory_rate'] > 0 and ((current_time - last_breath_start) > (60 / self['respiratory_rate'])):
-                    phase = self.phase.inspiratory
-                    current_volume = 0
-                    last_breath_start = current_time
-            current_time = current_time + time_step
     def interactive_shim(self, pressure_target, inspiratory_time, peep, respiratory_rate, 
         inspiratory_pause, resistance, compliance):
         self['pressure_target'] = pressure_target
@@ -71,26 +34,19 @@ class PressureVentilator(Ventilator):
         self.patient.resistance = resistance
         self.patient.compliance = compliance
 
-        self.simulate(12)
+        self.cachedSimulate(12)
 
-        f, (ax1,ax2,ax3) = plt.subplots(3,1,figsize=(12, 12))
-        ax1.set_ylim(0,50)
-        self.plot(['pressure', 'p_alv'], ax1)
-        self.plot('flow', ax2, scalefactor = 60)
-        ax2.set_ylim(-120, 120)
-        self.plot('volume', ax3, scalefactor = 1000)
-        ax3.set_ylim(0, 1000)
+        self.waveformFigure().update(self)
 
     def interact(self):
         import ipywidgets as widgets
-        import IPython.display
 
         pressure_target_widget = widgets.IntSlider(
             value = self['pressure_target'],
             min = 1,
             max = 40,
             step = 1,
-            continuous_update = False,
+            continuous_update = True,
             description = "PC")
 
         inspiratory_time_widget = widgets.FloatSlider(
@@ -98,7 +54,7 @@ class PressureVentilator(Ventilator):
             min = 0,
             max = 2,
             step = 0.05,
-            continuous_update = False,
+            continuous_update = True,
             description = "Ti   "
         )
 
@@ -107,7 +63,7 @@ class PressureVentilator(Ventilator):
             min = 0,
             max = 20,
             step = 1,
-            continuous_update = False,
+            continuous_update = True,
             description = "PEEP"
         )
 
@@ -117,7 +73,7 @@ class PressureVentilator(Ventilator):
             min = 0,
             max = 60,
             step = 1,
-            continuous_update = False,
+            continuous_update = True,
             description = "RR"
         )
 
@@ -126,7 +82,7 @@ class PressureVentilator(Ventilator):
             min = 1, 
             max = 50,
             step = 1,
-            continuous_update = False,
+            continuous_update = True,
             description = "Resistance"
         )
 
@@ -136,7 +92,7 @@ class PressureVentilator(Ventilator):
             max = -1,
             base = 10, 
             step = 0.01,
-            continuous_update = False,
+            continuous_update = True,
             description = "Compliance"
         )
 
@@ -144,13 +100,11 @@ class PressureVentilator(Ventilator):
         patient_ui = widgets.VBox([resistance_widget, compliance_widget])
         ui = widgets.HBox([vent_ui, patient_ui])
 
-        output = widgets.interactive_output(self.interactive_shim, 
+        return self.interactWith(ui,
         {'pressure_target': pressure_target_widget,
             'peep': peep_widget,
             'inspiratory_time': inspiratory_time_widget,
             'respiratory_rate': respiratory_rate_widget,
             'inspiratory_pause': widgets.fixed(0),
             'resistance': resistance_widget,
-            'compliance': compliance_widget})
-
-        return IPython.display.display(ui, output)
\ No newline at end of file
+            'compliance': compliance_widget})
\ No newline at end of file
@@ -0,0 +1,23 @@
+import numpy as np
+
+class RunConfiguration:
+    __slots__ = ['respiratory_rate', 'peep', 'inspiratory_pause', 'flow', 'rise_time', 'flow_pattern',
+                 'volume_target', 'pressure_target', 'inspiratory_time', 'flow_trigger', 'trigger_flow',
+                 'trigger_pressure', 'inspiratory_pressure', 'breath_length']
+
+    def __init__(self, resolved):
+        for key in self.__slots__:
+            object.__setattr__(self, key, resolved.get(key))
+
+        if self.pressure_target is not None:
+            object.__setattr__(self, 'inspiratory_pressure', self.pressure_target + self.peep)
+        # settings may be arrays, one entry per configuration of a batch
+        if np.ndim(self.respiratory_rate) == 0:
+            breath_length = 60 / self.respiratory_rate if self.respiratory_rate > 0 else np.inf
+        else:
+            breath_length = np.divide(60, self.respiratory_rate, out = np.full(np.shape(self.respiratory_rate), np.inf),
+                                      where = self.respiratory_rate > 0)
+        object.__setattr__(self, 'breath_length', breath_length)
+
+    def __setattr__(self, key, value):
+        raise AttributeError('RunConfiguration is frozen; change settings on the Ventilator instead')
@@ -0,0 +1,132 @@
+import json
+import os
+import time
+import numpy as np
+from VentSimulator.Patient import Patient
+from VentSimulator.MultiCompartmentPatient import MultiCompartmentPatient
+from VentSimulator.ComplianceCurve import SigmoidCurve, PiecewiseLinearCurve, TabulatedCurve
+from VentSimulator.MuscleEffort import MuscleEffort
+from VentSimulator.VolumeVentilator import VolumeVentilator
+from VentSimulator.PressureVentilator import PressureVentilator
+from VentSimulator.PressureSupportVentilator import PressureSupportVentilator
+
+class Scenario:
+    modes = {'VolumeVentilator': VolumeVentilator,
+             'PressureVentilator': PressureVentilator,
+             'PressureSupportVentilator': PressureSupportVentilator}
+    compliance_curves = {'sigmoid': SigmoidCurve, 'piecewise': PiecewiseLinearCurve, 'tabulated': TabulatedCurve}
+    fields = ['name', 'mode', 'settings', 'patient', 'time_length', 'time_step', 'method', 'record', 'fast_forward']
+
+    def __init__(self, name, mode, settings = None, patient = None, time_length = 60, time_step = 0.02,
+                 method = 'euler', record = 'trace', fast_forward = False):
+        if mode not in self.modes:
+            raise ValueError("Unknown mode '{}'".format(mode))
+        if method not in self.modes[mode].methods:
+            raise ValueError("Unknown simulation method '{}' for {} in scenario '{}'".format(method, mode, name))
+        if record not in self.modes[mode].record_modes:
+            raise ValueError("Unknown record mode '{}' in scenario '{}'".format(record, name))
+        self.name = name
+        self.mode = mode
+        self.settings = dict(settings or {})
+        self.patient = dict(patient or {})
+        self.time_length = time_length
+        self.time_step = time_step
+        self.method = method
+        self.record = record
+        self.fast_forward = fast_forward
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as file:
+            if path.endswith(('.yaml', '.yml')):
+                try:
+                    import yaml
+                except ImportError:
+                    raise ValueError("Reading '{}' needs PyYAML; use a JSON scenario file instead".format(path))
+                document = yaml.safe_load(file)
+            else:
+                document = json.load(file)
+
+        if isinstance(document, list):
+            document = {'scenarios': document}
+        defaults = document.get('defaults', {})
+        scenarios = []
+        for index, entry in enumerate(document.get('scenarios', [])):
+            values = dict(defaults, **entry)
+            values.setdefault('name', '{}-{}'.format(os.path.splitext(os.path.basename(path))[0], index))
+            unknown = set(values) - set(cls.fields)
+            if unknown:
+                raise ValueError("Unknown scenario field '{}'".format(sorted(unknown)[0]))
+            scenario = cls(**values)
+            scenario.buildVentilator().checkMethod(scenario.method, scenario.fast_forward)
+            scenarios.append(scenario)
+        return scenarios
+
+    @property
+    def steps(self):
+        return int(self.modes[self.mode].stepCount(self.time_length, self.time_step))
+
+    def buildPatient(self):
+        values = dict(self.patient)
+        curve = values.pop('compliance_curve', None)
+        effort = values.pop('effort', None)
+        if 'compliances' in values or 'resistances' in values:
+            patient = MultiCompartmentPatient(**values)
+        else:
+            patient = Patient()
+            for key, value in values.items():
+                if key not in ('resistance', 'compliance'):
+                    raise ValueError("Unknown patient parameter '{}'".format(key))
+                setattr(patient, key, value)
+
+        if curve is not None:
+            curve = dict(curve)
+            kind = curve.pop('type')
+            if kind not in self.compliance_curves:
+                raise ValueError("Unknown compliance curve '{}'".format(kind))
+            patient.setComplianceCurve(self.compliance_curves[kind](**curve))
+        if effort is not None:
+            patient.setEffort(MuscleEffort(**effort))
+        return patient
+
+    def buildVentilator(self):
+        ventilator_class = self.modes[self.mode]
+        if 'flow_pattern' in self.settings and not hasattr(ventilator_class, 'flow_patterns'):
+            raise ValueError("{} has no flow_pattern setting".format(self.mode))
+        ventilator = ventilator_class(self.buildPatient())
+        for key, value in self.settings.items():
+            if key not in ventilator_class.settings.__members__:
+                raise ValueError("Unknown setting '{}' in scenario '{}'".format(key, self.name))
+            if key == 'flow_pattern' and isinstance(value, str) and value in ventilator_class.flow_patterns.__members__:
+                value = ventilator_class.flow_patterns[value]
+            ventilator[key] = value
+        return ventilator
+
+    def run(self, output_directory, dtype = 'float64'):
+        ventilator = self.buildVentilator()
+        start = time.perf_counter()
+        if self.record == 'trace' and self.method == 'euler' and not self.fast_forward:
+            # stream straight to disk so long runs never hold the whole trace in memory
+            path = os.path.join(output_directory, self.name + '.vtr')
+            rows = ventilator.streamTrace(path, self.time_length, self.time_step, dtype = dtype)
+        else:
+            ventilator.simulate(self.time_length, self.time_step, method = self.method, record = self.record,
+                                fast_forward = self.fast_forward)
+            if self.record == 'trace':
+                path = os.path.join(output_directory, self.name + '.vtr')
+                ventilator.saveTrace(path, dtype)
+                rows = len(ventilator.output)
+            else:
+                path = os.path.join(output_directory, self.name + '.csv')
+                rows = self.saveSummary(ventilator, path)
+
+        return {'name': self.name, 'mode': self.mode, 'path': path, 'steps': self.steps, 'rows': rows,
+                'wall_time': time.perf_counter() - start, 'bytes': os.path.getsize(path)}
+
+    @staticmethod
+    def saveSummary(ventilator, path):
+        ventilator.flushSummary()
+        table = ventilator.summary.table()
+        np.savetxt(path, table, delimiter = ',', header = ','.join(metric.name for metric in ventilator.breath_metrics),
+                   comments = '')
+        return len(table)
@@ -0,0 +1,65 @@
+import hashlib
+from collections import OrderedDict
+from enum import Enum
+import numpy as np
+
+class SimulationCache:
+    def __init__(self, max_bytes = 64 * 2**20):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def canonical(value):
+        if isinstance(value, Enum):
+            return value.name
+        if isinstance(value, (int, float, np.number)):
+            return float(value)
+        if isinstance(value, (list, tuple, np.ndarray)):
+            return tuple(SimulationCache.canonical(item) for item in value)
+        return repr(value)
+
+    @classmethod
+    def key(cls, ventilator, time_length, time_step, method):
+        settings = sorted((key, cls.canonical(value)) for key, value in ventilator.resolvedSettings().items())
+        patient = sorted((key, cls.canonical(value)) for key, value in ventilator.patient.getParameters().items())
+        description = (type(ventilator).__qualname__, tuple(settings), float(time_length), float(time_step), method,
+                       type(ventilator.patient).__qualname__, tuple(patient))
+        return hashlib.sha1(repr(description).encode()).hexdigest()
+
+    def get(self, key):
+        if key not in self.entries:
+            self.misses = self.misses + 1
+            return None
+
+        self.hits = self.hits + 1
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key, columns, patient_volume, time_step):
+        if key in self.entries:
+            return
+
+        columns.flags.writeable = False
+        self.entries[key] = (columns, patient_volume, time_step)
+        self.size = self.size + columns.nbytes
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            _, (evicted, _, _) = self.entries.popitem(last = False)
+            self.size = self.size - evicted.nbytes
+            self.evictions = self.evictions + 1
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups > 0 else 0,
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'evictions': self.evictions}
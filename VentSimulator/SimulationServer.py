@@ -0,0 +1,254 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import signal
+import struct
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from VentSimulator.Scenario import Scenario
+from VentSimulator.SimulationCache import SimulationCache
+from VentSimulator.Ventilator import Ventilator
+
+WEBSOCKET_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+TEXT, BINARY, CLOSE, PING, PONG = 0x1, 0x2, 0x8, 0x9, 0xA
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+           500: 'Internal Server Error'}
+
+def encodeFrame(opcode, payload, mask = None):
+    # a single unfragmented frame; clients must mask theirs, servers must not
+    head = bytes([0x80 | opcode])
+    mask_bit = 0 if mask is None else 0x80
+    if len(payload) < 126:
+        head = head + bytes([mask_bit | len(payload)])
+    elif len(payload) < 2**16:
+        head = head + bytes([mask_bit | 126]) + struct.pack('!H', len(payload))
+    else:
+        head = head + bytes([mask_bit | 127]) + struct.pack('!Q', len(payload))
+    if mask is None:
+        return head + payload
+    return head + mask + applyMask(payload, mask)
+
+def applyMask(payload, mask):
+    data = np.frombuffer(payload, dtype = np.uint8)
+    return np.bitwise_xor(data, np.resize(np.frombuffer(mask, dtype = np.uint8), len(data))).tobytes()
+
+async def readFrame(reader, max_length):
+    first, second = await reader.readexactly(2)
+    length = second & 0x7F
+    if length == 126:
+        length, = struct.unpack('!H', await reader.readexactly(2))
+    elif length == 127:
+        length, = struct.unpack('!Q', await reader.readexactly(8))
+    if length > max_length:
+        raise ValueError('WebSocket frame of {} bytes exceeds the limit of {}'.format(length, max_length))
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    return first & 0x0F, payload if mask is None else applyMask(payload, mask)
+
+def runSimulation(scenario):
+    # runs in a worker process
+    ventilator = scenario.buildVentilator()
+    ventilator.simulate(scenario.time_length, scenario.time_step, method = scenario.method)
+    return ventilator.output.astype('<f4'), ventilator.patient.volume
+
+class SimulationServer:
+    # serves simulate() runs over HTTP (POST /simulate) and WebSocket (GET /ws) on asyncio, with the runs on a
+    # process pool. Identical requests share one run while it is in flight and recent results are cached,
+    # both keyed like SimulationCache, so settings that resolve to the same values are the same request
+    fields = ['mode', 'settings', 'patient', 'time_length', 'time_step', 'method']
+    MAX_STEPS = 2 * 10**6
+    MAX_REQUEST_BYTES = 2**20
+    CHUNK_ROWS = 4096
+
+    def __init__(self, host = '127.0.0.1', port = 8765, processes = None, cache_bytes = 256 * 2**20):
+        self.host = host
+        self.port = port
+        self.processes = processes
+        self.pool = None
+        self.cache = SimulationCache(cache_bytes)
+        self.in_flight = {}
+        self.requests = 0
+        self.simulations = 0
+        self.deduplicated = 0
+        self.stopping = None
+
+    def scenario(self, request):
+        if not isinstance(request, dict):
+            raise ValueError('A simulation request is a JSON object')
+        unknown = set(request) - set(self.fields) - {'id'}
+        if unknown:
+            raise ValueError("Unknown request field '{}'".format(sorted(unknown)[0]))
+        if 'mode' not in request:
+            raise ValueError('A simulation request needs a mode')
+        scenario = Scenario('request', **{key: value for key, value in request.items() if key in self.fields})
+        if scenario.time_step <= 0 or not 0 < scenario.steps <= self.MAX_STEPS:
+            raise ValueError('A simulation request runs between 1 and {} steps'.format(self.MAX_STEPS))
+        return scenario
+
+    async def result(self, request):
+        scenario = self.scenario(request)
+        self.requests = self.requests + 1
+        key = SimulationCache.key(scenario.buildVentilator(), scenario.time_length, scenario.time_step, scenario.method)
+        entry = self.cache.get(key)
+        if entry is not None:
+            return entry[0]
+
+        future = self.in_flight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(self.pool, runSimulation, scenario)
+            future.add_done_callback(lambda done: self.finished(key, scenario.time_step, done))
+            self.in_flight[key] = future
+            self.simulations = self.simulations + 1
+        else:
+            self.deduplicated = self.deduplicated + 1
+        # a client that goes away must not cancel the run the others are waiting on
+        rows, patient_volume = await asyncio.shield(future)
+        return rows
+
+    def finished(self, key, time_step, future):
+        self.in_flight.pop(key, None)
+        if not future.cancelled() and future.exception() is None:
+            rows, patient_volume = future.result()
+            self.cache.put(key, rows, patient_volume, time_step)
+
+    def stats(self):
+        return {'requests': self.requests, 'simulations': self.simulations, 'deduplicated': self.deduplicated,
+                'in_flight': len(self.in_flight), 'cache': self.cache.stats()}
+
+    @staticmethod
+    def describe(rows, request_id = None):
+        return {'id': request_id, 'columns': [parameter.name for parameter in Ventilator.parameters],
+                'rows': len(rows), 'dtype': rows.dtype.str}
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length', 0))
+                if length > self.MAX_REQUEST_BYTES:
+                    await self.respond(writer, 413, {'error': 'Request body too large'})
+                    break
+                body = await reader.readexactly(length)
+
+                if path == '/ws' and headers.get('upgrade', '').lower() == 'websocket':
+                    await self.websocket(reader, writer, headers)
+                    break
+                await self.route(writer, method, path, body)
+                if headers.get('connection', '').lower() == 'close' or version == 'HTTP/1.0':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, writer, method, path, body):
+        if path == '/stats':
+            await self.respond(writer, 200, self.stats())
+        elif path != '/simulate':
+            await self.respond(writer, 404, {'error': "Unknown path '{}'".format(path)})
+        elif method != 'POST':
+            await self.respond(writer, 405, {'error': 'POST a simulation request to /simulate'})
+        else:
+            try:
+                rows = await self.result(json.loads(body))
+            except (TypeError, ValueError) as error:
+                await self.respond(writer, 400, {'error': str(error)})
+                return
+            except Exception as error:
+                await self.respond(writer, 500, {'error': '{}: {}'.format(type(error).__name__, error)})
+                return
+            description = self.describe(rows)
+            await self.respond(writer, 200, rows.tobytes(), 'application/octet-stream',
+                               {'X-Columns': ','.join(description['columns']), 'X-Rows': len(rows),
+                                'X-Dtype': description['dtype']})
+
+    async def respond(self, writer, status, body, content_type = 'application/json', headers = None):
+        if content_type == 'application/json':
+            body = json.dumps(body).encode()
+        lines = ['HTTP/1.1 {} {}'.format(status, REASONS[status]), 'Content-Type: ' + content_type,
+                 'Content-Length: {}'.format(len(body))]
+        lines.extend('{}: {}'.format(*header) for header in (headers or {}).items())
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+    async def websocket(self, reader, writer, headers):
+        accept = base64.b64encode(hashlib.sha1(headers['sec-websocket-key'].encode() + WEBSOCKET_GUID).digest())
+        writer.write(b'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                     b'Sec-WebSocket-Accept: ' + accept + b'\r\n\r\n')
+        await writer.drain()
+
+        # each text message is a simulation request; the reply is a JSON header, the rows as binary
+        # messages of CHUNK_ROWS rows each, little-endian float32 row by row, and a JSON trailer
+        while True:
+            opcode, payload = await readFrame(reader, self.MAX_REQUEST_BYTES)
+            if opcode == CLOSE:
+                writer.write(encodeFrame(CLOSE, payload[:2]))
+                await writer.drain()
+                return
+            if opcode == PING:
+                writer.write(encodeFrame(PONG, payload))
+                continue
+            if opcode != TEXT:
+                continue
+
+            request_id = None
+            try:
+                request = json.loads(payload)
+                request_id = request.get('id') if isinstance(request, dict) else None
+                rows = await self.result(request)
+            except Exception as error:
+                message = str(error) if isinstance(error, (TypeError, ValueError)) else \
+                    '{}: {}'.format(type(error).__name__, error)
+                writer.write(encodeFrame(TEXT, json.dumps({'id': request_id, 'error': message}).encode()))
+                await writer.drain()
+                continue
+
+            writer.write(encodeFrame(TEXT, json.dumps(self.describe(rows, request_id)).encode()))
+            for start in range(0, len(rows), self.CHUNK_ROWS):
+                writer.write(encodeFrame(BINARY, rows[start:start + self.CHUNK_ROWS].tobytes()))
+                await writer.drain()
+            writer.write(encodeFrame(TEXT, json.dumps({'id': request_id, 'done': True}).encode()))
+            await writer.drain()
+
+    async def serve(self, started = None, handle_signals = False):
+        # runs until stop(); stopping shuts the worker processes down with the server
+        self.stopping = asyncio.Event()
+        if handle_signals:
+            for signal_number in (signal.SIGINT, signal.SIGTERM):
+                asyncio.get_running_loop().add_signal_handler(signal_number, self.stop)
+        with ProcessPoolExecutor(self.processes) as pool:
+            self.pool = pool
+            server = await asyncio.start_server(self.handle, self.host, self.port)
+            if started is not None:
+                started(server)
+            async with server:
+                await self.stopping.wait()
+
+    def stop(self):
+        self.stopping.set()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog = 'python -m VentSimulator.SimulationServer',
+                                     description = 'Serve ventilator simulations over local HTTP and WebSocket.')
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 8765)
+    parser.add_argument('--processes', type = int, default = None, help = 'worker processes (default: one per core)')
+    parser.add_argument('--cache-mib', type = int, default = 256, help = 'result cache size')
+    args = parser.parse_args()
+
+    server = SimulationServer(args.host, args.port, args.processes, args.cache_mib * 2**20)
+    asyncio.run(server.serve(lambda started: print('Serving on http://{}:{}'.format(args.host, args.port), flush = True),
+                             handle_signals = True))
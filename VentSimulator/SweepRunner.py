@@ -0,0 +1,90 @@
+import itertools
+import multiprocessing
+import threading
+from multiprocessing import shared_memory
+import numpy as np
+
+def simulateChunk(task):
+    ventilator_class, time_length, time_step, name, shape, start, config = task
+    memory = shared_memory.SharedMemory(name = name)
+    try:
+        output = np.ndarray(shape, dtype = np.float64, buffer = memory.buf)
+        count = len(config['peep'])
+        ventilator_class.simulate_batch(time_length, time_step, out = output[start:start + count], **config)
+        del output
+    finally:
+        memory.close()
+    return count
+
+class SweepRunner:
+    def __init__(self, ventilator_class, time_length = 60, time_step = 0.02, processes = None, chunk_size = 1024):
+        self.ventilator_class = ventilator_class
+        self.time_length = time_length
+        self.time_step = time_step
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self.memory = None
+        self.output = None
+        self.cancelled = False
+        self.cancel_event = threading.Event()
+
+    @staticmethod
+    def grid(**values):
+        values = {key: value if np.ndim(value) > 0 else [value] for key, value in values.items()}
+        indices = np.array(list(itertools.product(*[range(len(value)) for value in values.values()])))
+        return {key: np.asarray(value)[indices[:, column]] for column, (key, value) in enumerate(values.items())}
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def run(self, configs, progress = None):
+        configs = dict(configs)
+        config = self.ventilator_class.batchSettings(configs.pop('resistance', None), configs.pop('compliance', None), configs,
+                                                     configs.pop('effort', None))
+        total = len(config['peep'])
+        times = self.ventilator_class.batchTimes(self.time_length, self.time_step)
+        shape = (total, len(times) + 1, len(self.ventilator_class.parameters))
+
+        self.close()
+        self.cancelled = False
+        self.cancel_event.clear()
+        self.memory = shared_memory.SharedMemory(create = True, size = max(int(np.prod(shape)) * 8, 1))
+        self.output = np.ndarray(shape, dtype = np.float64, buffer = self.memory.buf)
+        self.output[:] = np.nan
+
+        tasks = [(self.ventilator_class, self.time_length, self.time_step, self.memory.name, shape, start,
+                  {key: value[start:start + self.chunk_size] for key, value in config.items()})
+                 for start in range(0, total, self.chunk_size)]
+
+        completed = 0
+        try:
+            with multiprocessing.Pool(self.processes) as pool:
+                for count in pool.imap_unordered(simulateChunk, tasks):
+                    completed = completed + count
+                    if progress is not None:
+                        progress(completed, total)
+                    if self.cancel_event.is_set():
+                        self.cancelled = True
+                        pool.terminate()
+                        break
+        finally:
+            # once the workers are done nothing else attaches by name, so the name goes now; the block itself
+            # stays mapped until close(), or until the runner is collected, so run() without a with block
+            # leaks nothing
+            self.memory.unlink()
+
+        return self.output
+
+    def close(self):
+        if self.memory is None:
+            return
+
+        self.output = None
+        self.memory.close()
+        self.memory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,144 @@
+import json
+import struct
+from enum import Enum
+import numpy as np
+
+# layout: magic | header length (uint32) | reserved (uint32) | row count (uint64) | JSON header, padded |
+# blocks of block_rows rows stored column by column, so one column of one block is contiguous on disk
+MAGIC = b'VENTTRC1'
+PREAMBLE = struct.Struct('<8sIIQ')
+ALIGNMENT = 64
+
+def jsonValue(value):
+    if isinstance(value, Enum):
+        return value.name
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [jsonValue(item) for item in value]
+    if isinstance(value, dict):
+        return {key: jsonValue(item) for key, item in value.items()}
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return repr(value)
+
+class TraceWriter:
+    def __init__(self, path, ventilator, time_step, dtype = 'float64', block_rows = 4096):
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in (np.dtype('float32'), np.dtype('float64')):
+            raise ValueError("Unknown trace dtype '{}'".format(dtype))
+
+        self.block_rows = block_rows
+        self.width = len(ventilator.parameters)
+        self.rows = 0
+        self.buffer = np.full((self.width, block_rows), np.nan, dtype = self.dtype)
+        self.buffered = 0
+
+        header = json.dumps({'ventilator': type(ventilator).__name__,
+                             'parameters': {parameter.name: parameter.value - 1 for parameter in ventilator.parameters},
+                             'settings': jsonValue(ventilator.resolvedSettings()),
+                             'patient': jsonValue(ventilator.patient.getParameters()),
+                             'time_step': time_step,
+                             'dtype': self.dtype.str,
+                             'block_rows': block_rows}).encode()
+        header = header + b' ' * (-(PREAMBLE.size + len(header)) % ALIGNMENT)
+
+        self.file = open(path, 'wb')
+        self.file.write(PREAMBLE.pack(MAGIC, len(header), 0, 0))
+        self.file.write(header)
+
+    def write(self, rows):
+        rows = np.asarray(rows)
+        offset = 0
+        while offset < len(rows):
+            count = min(len(rows) - offset, self.block_rows - self.buffered)
+            self.buffer[:, self.buffered:self.buffered + count] = rows[offset:offset + count].T
+            self.buffered = self.buffered + count
+            offset = offset + count
+            if self.buffered == self.block_rows:
+                self.flush()
+        self.rows = self.rows + len(rows)
+
+    def flush(self):
+        if self.buffered == 0:
+            return
+        self.file.write(self.buffer.tobytes())
+        self.buffer[:] = np.nan
+        self.buffered = 0
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.flush()
+        self.file.seek(PREAMBLE.size - 8)
+        self.file.write(struct.pack('<Q', self.rows))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+class TraceReader:
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            magic, header_length, reserved, self.rows = PREAMBLE.unpack(file.read(PREAMBLE.size))
+            if magic != MAGIC:
+                raise ValueError("'{}' is not a trace file".format(path))
+            header = json.loads(file.read(header_length))
+
+        self.ventilator = header['ventilator']
+        self.parameters = header['parameters']
+        self.settings = header['settings']
+        self.patient = header['patient']
+        self.time_step = header['time_step']
+        self.block_rows = header['block_rows']
+        self.width = len(self.parameters)
+
+        dtype = np.dtype(header['dtype'])
+        blocks = -(-self.rows // self.block_rows)
+        if blocks == 0:
+            self.blocks = np.empty((0, self.width, self.block_rows), dtype = dtype)
+        else:
+            self.blocks = np.memmap(path, dtype = dtype, mode = 'r', offset = PREAMBLE.size + header_length,
+                                    shape = (blocks, self.width, self.block_rows))
+
+    def __len__(self):
+        return self.rows
+
+    def rowRange(self, start, stop):
+        start, stop, step = slice(start, stop).indices(self.rows)
+        return start, max(start, stop)
+
+    def column(self, key, start = None, stop = None):
+        start, stop = self.rowRange(start, stop)
+        first, last = start // self.block_rows, -(-stop // self.block_rows)
+        values = self.blocks[first:last, self.parameters[key], :].reshape(-1)
+        return values[start - first * self.block_rows:stop - first * self.block_rows]
+
+    def data(self, key):
+        return self.column(key)
+
+    def slice(self, start = None, stop = None):
+        return np.column_stack([self.column(key, start, stop) for key in self.parameters])
+
+    def findTime(self, time):
+        # bisect on the memory-mapped time column, touching one page per probe
+        column = self.parameters['time']
+        low, high = 0, self.rows
+        while low < high:
+            middle = (low + high) // 2
+            if self.blocks[middle // self.block_rows, column, middle % self.block_rows] < time:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def window(self, start_time, stop_time, keys = None):
+        start, stop = self.findTime(start_time), self.findTime(stop_time)
+        if keys is None:
+            return self.slice(start, stop)
+        return {key: self.column(key, start, stop) for key in keys}
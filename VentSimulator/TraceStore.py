@@ -0,0 +1,47 @@
+import numpy as np
+
+class TraceStore:
+    GROWTH_FACTOR = 2
+
+    def __init__(self, width, capacity = 16):
+        self.width = width
+        self.length = 0
+        self.columns = np.full((width, max(int(capacity), 1)), np.nan)
+
+    @property
+    def capacity(self):
+        return self.columns.shape[1]
+
+    @property
+    def cursor(self):
+        return self.length - 1
+
+    def reserve(self, capacity):
+        if capacity <= self.capacity:
+            return
+
+        new_capacity = max(int(capacity), self.capacity * self.GROWTH_FACTOR)
+        columns = np.full((self.width, new_capacity), np.nan)
+        columns[:, :self.length] = self.columns[:, :self.length]
+        self.columns = columns
+
+    def append(self):
+        self.reserve(self.length + 1)
+        self.length = self.length + 1
+        return self.cursor
+
+    def extend(self, count):
+        self.reserve(self.length + count)
+        start = self.length
+        self.length = self.length + count
+        return slice(start, self.length)
+
+    def clear(self):
+        self.columns[:, :self.length] = np.nan
+        self.length = 0
+
+    def column(self, index):
+        return self.columns[index, :self.length]
+
+    def rows(self):
+        return self.columns[:, :self.length].T
@@ -1,25 +1,64 @@
 import matplotlib.pyplot as plt
 import numpy as np
 from VentSimulator.Patient import Patient
+from VentSimulator.MultiCompartmentPatient import MultiCompartmentPatient
+from VentSimulator.MuscleEffort import MuscleEffort
+from VentSimulator.TraceStore import TraceStore
+from VentSimulator.TraceFile import TraceWriter
+from VentSimulator.BreathSummary import BreathSummary
+from VentSimulator.SimulationCache import SimulationCache
+from VentSimulator.WaveformFigure import WaveformFigure
+from VentSimulator.Decimator import Decimator
+from VentSimulator.Integrator import RK45Integrator, ImplicitIntegrator
+from VentSimulator.RunConfiguration import RunConfiguration
+from VentSimulator.PhaseLaw import PhaseLaw
+from VentSimulator.FastForward import FastForward
+from VentSimulator.Instrumentation import Instrumentation
 
 class Ventilator:
     from enum import IntEnum, Enum
-    parameters = IntEnum('parameters', ['time', 'pressure', 'flow', 'volume', 'p_alv', 'peak_flow'])
-    phase = Enum('phase', ['inspiratory', 'expiratory', 'inspiratory_pause'])
+    parameters = IntEnum('parameters', ['time', 'pressure', 'flow', 'volume', 'p_alv', 'peak_flow', 'p_mus'],
+                         module = __name__, qualname = 'Ventilator.parameters')
+    phase = Enum('phase', ['inspiratory', 'expiratory', 'inspiratory_pause'],
+                 module = __name__, qualname = 'Ventilator.phase')
     settings = Enum('settings', ['respiratory_rate', 'peep', 'inspiratory_pause', 'flow', 'rise_time', 
-                                 'flow_pattern', 'volume_target', 'pressure_target', 'inspiratory_time', 'flow_trigger'])
+                                 'flow_pattern', 'volume_target', 'pressure_target', 'inspiratory_time', 'flow_trigger',
+                                 'trigger_flow', 'trigger_pressure'],
+                    module = __name__, qualname = 'Ventilator.settings')
+    breath_metrics = BreathSummary.metrics
     
     CLOSE_ENOUGH = 0.001
+    SUMMARY_BLOCK_LENGTH = 4096
+    EVENT_TOLERANCE = 1e-10
+    STEADY_STATE_TOLERANCE = 1e-9
+    STEP_DECIMALS = 9
+    methods = ['euler', 'rk45', 'implicit']
+    integrators = {'rk45': RK45Integrator, 'implicit': ImplicitIntegrator}
+    records_peak_flow = False
+    record_modes = ['trace', 'summary']
     
     global_defaults = {settings.respiratory_rate: 10, 
                        settings.peep: 0, 
                        settings.inspiratory_pause: 0,
-                       settings.rise_time: 0}
+                       settings.rise_time: 0,
+                       settings.trigger_flow: None,
+                       settings.trigger_pressure: None}
     mode_defaults = {}
+    simulation_cache = SimulationCache()
+    volume_limits = (0, 1000)
     
 
     def __init__(self, patient):
         self.patient = None
+        self.recording = 'trace'
+        self.time_step = None
+        self.current_phase = None
+        self.fast_forward = None
+        self.instrumentation = None
+        self.phase_table = None
+        self.summary = None
+        self.waveform_figure = None
+        self.run_configuration = None
         self.setOutputLength(10)
         self.current_settings = {}
         
@@ -39,38 +78,789 @@ class Ventilator:
     
     def __setitem__(self, key, value):
         self.current_settings[self.settings[key]] = value
+        self.run_configuration = None
+
+    def configuration(self):
+        if self.run_configuration is None:
+            self.run_configuration = RunConfiguration(self.resolvedSettings())
+        return self.run_configuration
+
+    def columnIndices(self, *keys):
+        return [self.parameters[key] - 1 for key in keys]
+
+    def resolvedSettings(self):
+        resolved = {}
+        for setting in self.settings:
+            if setting in self.current_settings or setting in self.mode_defaults or setting in self.global_defaults:
+                resolved[setting.name] = self[setting.name]
+        return resolved
         
     def setOutputLength(self, length):
         self.output_length = length
-        self.output = np.full((self.output_length, len(self.parameters)), np.nan)
-        self.output[0,:] = 0
+        self.trace = TraceStore(len(self.parameters), self.output_length)
+        self.trace.columns[:, self.trace.append()] = 0
+
+    @property
+    def output(self):
+        return self.trace.rows()
         
-    def simulate(self, time_length, time_step):
-        self.setOutputLength(int(np.ceil(1/time_step) + 1) * time_length)
+    def checkMethod(self, method, fast_forward = False):
+        if method not in self.methods:
+            raise ValueError("Unknown simulation method '{}'".format(method))
+        if fast_forward and method != 'euler':
+            raise ValueError("Fast-forward needs the 'euler' method, not '{}'".format(method))
+        if method != 'euler' and isinstance(self.patient, MultiCompartmentPatient):
+            raise ValueError("Simulation method '{}' needs a single-compartment Patient".format(method))
+        if method == 'analytic' and self.patient.compliance_curve is not None:
+            raise ValueError("Simulation method 'analytic' needs a linear compliance")
+        if method == 'analytic' and self.patientTriggered():
+            raise ValueError("Simulation method 'analytic' has no model of patient effort or triggering")
+        if fast_forward and self.patientTriggered():
+            raise ValueError("Fast-forward needs timed breaths, without patient effort or triggering")
+
+    def patientTriggered(self):
+        return self.patient.effort is not None or self['trigger_flow'] is not None or self['trigger_pressure'] is not None
+
+    def simulate(self, time_length = 60, time_step = 0.02, method = 'euler', record = 'trace', fast_forward = False):
+        self.checkMethod(method, fast_forward)
+        self.setupRun(time_length, time_step, record)
+
+        if method == 'analytic':
+            return self.simulateAnalytic(time_length, time_step)
+
+        if method in self.integrators:
+            return self.simulateAdaptive(time_length, time_step, self.integrators[method]())
+
+        self.runPhaseMachine(time_length, time_step, fast_forward)
+
+    def setupRun(self, time_length, time_step, record):
+        if record not in self.record_modes:
+            raise ValueError("Unknown record mode '{}'".format(record))
+
+        self.recording = record
+        self.time_step = time_step
+        self.patient.setTimeStep(time_step)
         self.patient.setPeepHint(self['peep'])
+
+        if self.recording == 'summary':
+            self.summary = BreathSummary(self.parameters, self.phase, self['peep'])
+            self.trace = TraceStore(len(self.parameters), self.SUMMARY_BLOCK_LENGTH)
+            self.trace_phases = np.zeros(self.SUMMARY_BLOCK_LENGTH, dtype = int)
+            return
+
+        self.summary = None
+        self.setOutputLength(int(self.stepCount(time_length, time_step)) + 1)
         self.record({'pressure': self['peep'], 'p_alv': self['peep']})
-    
-    def tick(self):
-        self.output = np.roll(self.output, 1, axis = 0)
+
+    @classmethod
+    def stepCount(cls, duration, time_step):
+        # whole steps covering duration; rounding first keeps a duration that is a multiple of the step, like
+        # 0.8 s at 0.02 s, from gaining a step through float error. Infinite durations stay infinite
+        return np.ceil(np.round(np.divide(duration, time_step), cls.STEP_DECIMALS))
+
+    def phaseSteps(self, duration, time_step):
+        if time_step is None:
+            return None
+        steps = self.stepCount(duration, time_step)
+        return steps if np.ndim(steps) else float(steps)
+
+    def afterInspiration(self, config):
+        # the pause when there is one; a batch table gives each configuration's next phase as a phase value
+        if np.ndim(config.inspiratory_pause) == 0:
+            return self.phase.inspiratory_pause if config.inspiratory_pause > 0 else self.phase.expiratory
+        return np.where(config.inspiratory_pause > 0, self.phase.inspiratory_pause.value, self.phase.expiratory.value)
+
+    def phaseLaws(self, config, time_step):
+        # the phases every mode shares; a mode adds its inspiratory law. The laws read the patient when they
+        # are called, so a table stays valid until the settings change. Settings may be arrays, for a batch
+        peep = config.peep
+        inspiratory_pause = config.inspiratory_pause
+        breath_length = config.breath_length
+        return {self.phase.inspiratory_pause:
+                    PhaseLaw(lambda elapsed, p_alv: PhaseLaw.constant(0, p_alv),
+                             lambda flow, p_alv: p_alv,
+                             lambda time, phase_start, breath_start, breath_volume, flow, peak_flow:
+                                 time - (phase_start + inspiratory_pause),
+                             self.phase.expiratory,
+                             phase_steps = self.phaseSteps(inspiratory_pause, time_step)),
+                self.phase.expiratory:
+                    PhaseLaw(lambda elapsed, p_alv: -1 * ((p_alv - peep) / self.patient.resistance),
+                             lambda flow, p_alv: PhaseLaw.constant(peep, p_alv),
+                             lambda time, phase_start, breath_start, breath_volume, flow, peak_flow:
+                                 (time - breath_start) - breath_length,
+                             self.phase.inspiratory,
+                             breath_steps = self.phaseSteps(breath_length, time_step),
+                             trigger = self.triggerLaw(config),
+                             target_pressure = peep)}
+
+    def triggerLaw(self, config):
+        # a patient-triggered breath: inspiratory flow above trigger_flow, or alveolar pressure pulled more
+        # than trigger_pressure below PEEP
+        trigger_flow = config.trigger_flow
+        trigger_pressure = config.trigger_pressure
+        if trigger_flow is None and trigger_pressure is None:
+            return None
+        if trigger_pressure is None:
+            return lambda flow, p_alv: flow - trigger_flow
+        if trigger_flow is None:
+            return lambda flow, p_alv: (config.peep - trigger_pressure) - p_alv
+        # fmax, so that in a batch a configuration without one of the triggers still has the other
+        return lambda flow, p_alv: np.fmax(flow - trigger_flow, (config.peep - trigger_pressure) - p_alv)
+
+    def phaseTable(self, time_step = None):
+        config = self.configuration()
+        if self.phase_table is None or self.phase_table[0] is not config or self.phase_table[1] != time_step:
+            self.phase_table = (config, time_step, self.phaseLaws(config, time_step))
+        return self.phase_table[2]
+
+    def phaseFlow(self, phase, elapsed, p_alv):
+        return self.phaseTable(self.time_step)[phase].flow(elapsed, p_alv)
+
+    def phasePressure(self, phase, flow, p_alv):
+        return self.phaseTable(self.time_step)[phase].pressure(flow, p_alv)
+
+    def phaseCycle(self, phase, time, phase_start, breath_start, breath_volume, flow, peak_flow):
+        return self.phaseTable(self.time_step)[phase].cycle(time, phase_start, breath_start, breath_volume, flow, peak_flow)
+
+    def phaseTrigger(self, phase, flow, p_alv):
+        trigger = self.phaseTable(self.time_step)[phase].trigger
+        return -np.inf if trigger is None else trigger(flow, p_alv)
+
+    def nextPhase(self, phase):
+        return self.phaseTable(self.time_step)[phase].next_phase
+
+    def alveolarPressure(self, time, volume):
+        if self.patient.effort is None:
+            return self.patient.pressureAt(volume)
+        return self.patient.pressureAt(volume) - self.patient.effort.pressureAt(time)
+
+    def phaseMachine(self, time_step, start_step = 0):
+        # the step loop of every mode; the current phase's row of the phase table supplies its flow and
+        # pressure laws and its cycling condition. The clock is an integer step count with time = step *
+        # time_step, so time does not drift over long runs and timed phases end on exact steps
+        inspiratory = self.phase.inspiratory
+        phase = inspiratory
+        step = start_step
+        current_volume = 0
+        peak_flow = 0
+        breath_start = start_step
+        phase_start = start_step
+        records_peak_flow = self.records_peak_flow
+        time_column, flow_column, volume_column, pressure_column, p_alv_column, peak_flow_column, p_mus_column = \
+            self.columnIndices('time', 'flow', 'volume', 'pressure', 'p_alv', 'peak_flow', 'p_mus')
+        # the patient's muscle pressure is sampled a block of steps at a time, so a run without an end holds
+        # no more of the waveform than one block
+        effort = self.patient.effort
+        p_mus = 0
+        block_start = start_step
+        block_end = start_step
+
+        config = self.configuration()
+        law = self.phaseTable(time_step)[phase]
+        phase_end = law.end(phase_start, breath_start)
+        flow_samples = law.flow_samples
+        flow_cursor = 0
+        last_sample = 0 if flow_samples is None else len(flow_samples) - 1
+
+        while True:
+            yield step
+            if self.run_configuration is not config:
+                config = self.configuration()
+                law = self.phaseTable(time_step)[phase]
+                phase_end = law.end(phase_start, breath_start)
+            patient = self.patient
+            current_time = step * time_step
+            cursor = self.tick(phase)
+            columns = self.trace.columns
+            columns[time_column, cursor] = current_time
+
+            if effort is not None:
+                if step >= block_end:
+                    block_start = step
+                    block_end = step + effort.BLOCK_LENGTH
+                    p_mus_block = effort.samples(block_start, effort.BLOCK_LENGTH, time_step).tolist()
+                p_mus = p_mus_block[step - block_start]
+                columns[p_mus_column, cursor] = p_mus
+
+            if flow_samples is None:
+                current_flow = law.flow(current_time - phase_start * time_step, patient.getPressure() - p_mus)
+            else:
+                current_flow = flow_samples[flow_cursor]
+                if flow_cursor < last_sample:
+                    flow_cursor = flow_cursor + 1
+
+            delta_volume = current_flow * time_step
+            patient.addVolume(delta_volume)
+            current_volume = current_volume + delta_volume
+
+            p_alv = patient.getPressure() - p_mus
+            columns[flow_column, cursor] = current_flow
+            columns[volume_column, cursor] = current_volume
+            columns[pressure_column, cursor] = law.pressure(current_flow, p_alv)
+            columns[p_alv_column, cursor] = p_alv
+            if phase is inspiratory and current_flow > peak_flow:
+                peak_flow = current_flow
+            if records_peak_flow and phase is inspiratory:
+                columns[peak_flow_column, cursor] = peak_flow
+
+            step = step + 1
+            if phase_end is None:
+                cycled = law.cycle(step * time_step, phase_start * time_step, breath_start * time_step,
+                                   current_volume, current_flow, peak_flow) > 0
+            else:
+                cycled = step >= phase_end
+            if not cycled and law.trigger is not None:
+                cycled = law.trigger(current_flow, p_alv) > 0
+            if cycled:
+                phase = law.next_phase
+                phase_start = step
+                if phase is inspiratory:
+                    current_volume = 0
+                    peak_flow = 0
+                    breath_start = step
+                # a flow profile is read from the settings in force when its phase starts
+                law = self.phaseTable(time_step)[phase]
+                phase_end = law.end(phase_start, breath_start)
+                flow_samples = law.flow_samples
+                flow_cursor = 0
+                last_sample = 0 if flow_samples is None else len(flow_samples) - 1
+
+    def instrument(self, on_breath = None, on_phase_change = None):
+        if self.instrumentation is None:
+            self.instrumentation = Instrumentation(self)
+        if on_breath is not None:
+            self.instrumentation.breath_callbacks.append(on_breath)
+        if on_phase_change is not None:
+            self.instrumentation.phase_callbacks.append(on_phase_change)
+        return self.instrumentation
+
+    def uninstrument(self):
+        if self.instrumentation is not None:
+            self.instrumentation.detach()
+        self.instrumentation = None
+
+    def runPhaseMachine(self, time_length, time_step, fast_forward = False):
+        if fast_forward:
+            self.fast_forward = FastForward(self, time_length, time_step, self.STEADY_STATE_TOLERANCE)
+            self.fast_forward.run()
+            return
+
+        steps = self.stepCount(time_length, time_step)
+        for step in self.phaseMachine(time_step):
+            if step >= steps:
+                break
+
+    def simulateAdaptive(self, time_length, time_step, integrator):
+        steps = int(self.stepCount(time_length, time_step))
+        index = 0
+        self.integrator_steps = 0
+
+        phase = self.phase.inspiratory
+        current_time = 0
+        volume = np.array([float(self.patient.volume)])
+        phase_start = 0
+        breath_start = 0
+        breath_start_volume = volume[0]
+
+        def rhs(time, y):
+            return np.array([self.phaseFlow(phase, time - phase_start, self.alveolarPressure(time, y[0]))])
+
+        def cycle(time, y):
+            if time < first_sample:
+                return -np.inf
+            flow = rhs(time, y)[0]
+            return max(self.phaseCycle(phase, time, phase_start, breath_start, y[0] - breath_start_volume,
+                                       flow, max(peak_flow, flow)),
+                       self.phaseTrigger(phase, flow, self.alveolarPressure(time, y[0])))
+
+        peak_flow = rhs(current_time, volume)[0]
+        first_sample = -np.inf
+        while index < steps:
+            cycled = cycle(current_time, volume) >= 0
+            if not cycled:
+                for t_a, y_a, f_a, t_b, y_b, f_b in integrator.steps(rhs, current_time, volume, time_length):
+                    self.integrator_steps = self.integrator_steps + 1
+                    step_end, step_volume = t_b, y_b
+                    if cycle(t_b, y_b) >= 0:
+                        step_end, step_volume = self.locateEvent(cycle, integrator, t_a, y_a, f_a, t_b, y_b, f_b)
+                        cycled = True
+
+                    end = min(self.samplesUntil(step_end, time_step), steps)
+                    if end > index:
+                        # recorded as it is produced, so a summary run holds no more than one phase
+                        times = np.arange(index, end) * time_step
+                        volumes = integrator.interpolate(t_a, y_a, f_a, t_b, y_b, f_b, times)[:, 0]
+                        self.recordBlock(*self.adaptiveBlock(phase, times, volumes, phase_start,
+                                                             breath_start_volume, peak_flow))
+                        index = end
+
+                    if phase == self.phase.inspiratory:
+                        peak_flow = max(peak_flow, rhs(step_end, step_volume)[0])
+                    current_time, volume = step_end, step_volume
+                    if cycled:
+                        break
+            if not cycled:
+                break
+
+            phase = self.nextPhase(phase)
+            phase_start = current_time
+            if phase == self.phase.inspiratory:
+                breath_start = current_time
+                breath_start_volume = volume[0]
+                peak_flow = rhs(current_time, volume)[0]
+            # a phase that would cycle as it starts lasts until its first output sample, as it would a step
+            first_sample = -np.inf
+            if index < steps and cycle(current_time, volume) >= 0:
+                first_sample = index * time_step
+
+        self.patient.volume = volume[0]
+
+    @staticmethod
+    def samplesUntil(time, time_step):
+        # the number of output samples, at step * time_step, up to and including time
+        count = int(time / time_step) + 1
+        while count > 0 and (count - 1) * time_step > time:
+            count = count - 1
+        while count * time_step <= time:
+            count = count + 1
+        return count
+
+    def simulateAnalytic(self, time_length, time_step):
+        # closed-form runs of a mode whose phases each drive alveolar pressure exponentially toward their
+        # target pressure, or hold it, read from the same phase table as the step loop; the rows are written
+        # into the recorded block a piece of a phase at a time
+        steps = int(self.stepCount(time_length, time_step))
+        # a summary is reduced a bounded block at a time, like the step loop's
+        block_length = self.SUMMARY_BLOCK_LENGTH if self.recording == 'summary' else steps
+        decay = np.ones(0)
+        columns = None
+        block_start = 0
+        block_end = 0
+        for segment in self.analyticPhases(steps, time_step):
+            phase, law, first_row, end_row = segment[:4]
+            row = first_row
+            while row < end_row:
+                if row == block_end:
+                    if columns is not None:
+                        self.recordColumns(columns, phases)
+                    block_start = row
+                    block_end = min(row + block_length, steps)
+                    columns = self.blockColumns(block_end - block_start)
+                    phases = np.empty(block_end - block_start, dtype = int)
+                count = min(end_row, block_end) - row
+                if count > len(decay):
+                    # one table of exp(-t / RC) over whole steps serves every phase
+                    decay = np.exp(-np.arange(count) * time_step / (self.patient.resistance * self.patient.compliance))
+                self.analyticRows(columns[:, row - block_start:row - block_start + count], segment, row - first_row,
+                                  time_step, decay[:count])
+                phases[row - block_start:row - block_start + count] = phase.value
+                row = row + count
+
+        if columns is not None:
+            self.recordColumns(columns, phases)
+            self.patient.volume = self.patient.compliance * columns[self.parameters.p_alv - 1, -1]
+
+    def analyticPhases(self, steps, time_step):
+        # each phase from its start: its rows first_row to end_row, the time offset from its start to its first
+        # row, alveolar pressure at its start and at the start of the breath, and the breath's peak flow. Timed
+        # phases end on whole steps and last at least one, like in the step loop; a phase that cycles between
+        # steps ends after its cycle_time, and the next one starts with an offset
+        laws = self.phaseTable(time_step)
+        resistance = self.patient.resistance
+        time_constant = resistance * self.patient.compliance
+        phase = self.phase.inspiratory
+        first_row = 0
+        breath_start = 0
+        offset = 0
+        start_pressure = self.patient.getPressure()
+        breath_pressure = start_pressure
+        peak_flow = 0
+        while first_row < steps:
+            law = laws[phase]
+            flow = 0 if law.target_pressure is None else (law.target_pressure - start_pressure) / resistance
+            if phase is self.phase.inspiratory:
+                breath_start, breath_pressure, peak_flow = first_row, start_pressure, flow
+
+            end = law.end(first_row, breath_start)
+            if end is None:
+                duration = law.cycle_time(time_constant, flow)
+                end_row = first_row + self.stepCount(max(duration - offset, 0), time_step)
+            else:
+                end_row = max(end, first_row + 1)
+                duration = offset + (end_row - first_row) * time_step
+            yield phase, law, first_row, int(min(end_row, steps)), offset, start_pressure, breath_pressure, peak_flow
+            if end_row >= steps:
+                return
+
+            start_pressure = self.relaxedPressure(law, start_pressure, duration, time_constant)
+            offset = 0 if end is not None else offset + (end_row - first_row) * time_step - duration
+            phase = law.next_phase
+            first_row = int(end_row)
+
+    @staticmethod
+    def relaxedPressure(law, start_pressure, elapsed, time_constant):
+        if law.target_pressure is None:
+            return start_pressure
+        return law.target_pressure + (start_pressure - law.target_pressure) * np.exp(-elapsed / time_constant)
+
+    def analyticRows(self, columns, segment, start, time_step, decay):
+        # rows start to start + len(decay) of a phase from analyticPhases(), into columns
+        phase, law, first_row, end_row, offset, start_pressure, breath_pressure, peak_flow = segment
+        resistance = self.patient.resistance
+        time_constant = resistance * self.patient.compliance
+        time, flow, volume, pressure, p_alv, peak_flow_column = [
+            columns[column] for column in self.columnIndices('time', 'flow', 'volume', 'pressure', 'p_alv', 'peak_flow')]
+
+        np.multiply(np.arange(first_row + start, first_row + start + len(decay)), time_step, out = time)
+        if law.target_pressure is None:
+            p_alv[:] = start_pressure
+            flow[:] = 0
+        else:
+            scale = np.exp(-(offset + start * time_step) / time_constant)
+            p_alv[:] = law.target_pressure + (start_pressure - law.target_pressure) * scale * decay
+            flow[:] = (law.target_pressure - p_alv) / resistance
+        pressure[:] = law.pressure(flow, p_alv)
+        volume[:] = self.patient.compliance * (p_alv - breath_pressure)
+        if self.records_peak_flow:
+            peak_flow_column[:] = peak_flow if phase is self.phase.inspiratory else np.nan
+
+    def locateEvent(self, cycle, integrator, t_a, y_a, f_a, t_b, y_b, f_b):
+        low, high = t_a, t_b
+        while high - low > self.EVENT_TOLERANCE * max(1, high):
+            middle = (low + high) / 2
+            if cycle(middle, integrator.interpolate(t_a, y_a, f_a, t_b, y_b, f_b, middle)[0]) >= 0:
+                high = middle
+            else:
+                low = middle
+        return high, integrator.interpolate(t_a, y_a, f_a, t_b, y_b, f_b, high)[0]
+
+    def adaptiveBlock(self, phase, time, volume, phase_start, breath_start_volume, peak_flow):
+        p_alv = self.alveolarPressure(time, volume)
+        flow = self.phaseFlow(phase, time - phase_start, p_alv)
+        values = {'time': time,
+                  'flow': flow,
+                  'volume': volume - breath_start_volume,
+                  'pressure': self.phasePressure(phase, flow, p_alv),
+                  'p_alv': p_alv}
+        if self.records_peak_flow:
+            values['peak_flow'] = np.full(len(time), peak_flow if phase == self.phase.inspiratory else np.nan)
+        if self.patient.effort is not None:
+            values['p_mus'] = self.patient.effort.pressureAt(time)
+        return values, np.full(len(time), phase.value)
+
+    def cachedSimulate(self, time_length, time_step = 0.02, method = 'euler'):
+        key = self.simulation_cache.key(self, time_length, time_step, method)
+        entry = self.simulation_cache.get(key)
+        if entry is None:
+            self.simulate(time_length, time_step, method = method)
+            self.simulation_cache.put(key, self.trace.columns[:, :self.trace.length].copy(), self.patient.volume,
+                                      time_step)
+            return
+
+        columns, patient_volume, time_step = entry
+        self.recording = 'trace'
+        self.time_step = time_step
+        self.summary = None
+        self.trace = TraceStore(len(self.parameters), 1)
+        self.trace.columns = columns
+        self.trace.length = columns.shape[1]
+        self.patient.volume = patient_volume
+
+    def stream(self, time_length = None, time_step = 0.02, chunk_length = 500):
+        self.recording = 'trace'
+        self.summary = None
+        self.time_step = time_step
+        self.patient.setTimeStep(time_step)
+        self.patient.setPeepHint(self['peep'])
+        self.setOutputLength(chunk_length)
+        self.record({'pressure': self['peep'], 'p_alv': self['peep']})
+
+        steps = np.inf if time_length is None else self.stepCount(time_length, time_step)
+        for step in self.phaseMachine(time_step):
+            if step >= steps:
+                break
+            if self.trace.length == chunk_length:
+                yield self.trace.rows().copy()
+                self.trace.clear()
+
+        if self.trace.length > 0:
+            yield self.trace.rows().copy()
+
+    def saveTrace(self, path, dtype = 'float64'):
+        if self.summary is not None:
+            raise ValueError("Saving a trace needs a run recorded with record = 'trace'")
+        with TraceWriter(path, self, self.time_step, dtype) as writer:
+            writer.write(self.output)
+
+    def streamTrace(self, path, time_length, time_step = 0.02, chunk_length = 4096, dtype = 'float64'):
+        with TraceWriter(path, self, time_step, dtype, block_rows = chunk_length) as writer:
+            for chunk in self.stream(time_length, time_step, chunk_length):
+                writer.write(chunk)
+        return writer.rows
+
+    @classmethod
+    def batchSettings(cls, resistance, compliance, settings, effort = None):
+        for key in settings:
+            cls.settings[key]
+
+        patient = Patient()
+        values = {'resistance': patient.resistance if resistance is None else resistance,
+                  'compliance': patient.compliance if compliance is None else compliance,
+                  'effort': np.array(effort, dtype = object) if isinstance(effort, (list, tuple)) else effort}
+        for setting in cls.settings:
+            if setting.name in settings:
+                values[setting.name] = settings[setting.name]
+            elif setting in cls.mode_defaults:
+                values[setting.name] = cls.mode_defaults[setting]
+            elif setting in cls.global_defaults:
+                values[setting.name] = cls.global_defaults[setting]
+
+        arrays = np.broadcast_arrays(*[np.asarray(values[key]) for key in values])
+        config = {key: np.array(array).ravel() for key, array in zip(values, arrays)}
+        # an unset trigger is NaN, which no flow or pressure crosses
+        for key in ('trigger_flow', 'trigger_pressure'):
+            config[key] = np.array([np.nan if value is None else value for value in config[key]], dtype = float)
+        return config
+
+    @staticmethod
+    def batchVolume(pressure, compliance, compliance_curve):
+        if compliance_curve is None:
+            return compliance * pressure
+        return np.broadcast_to(compliance_curve.compile().volume(pressure), np.broadcast(pressure, compliance).shape)
+
+    @staticmethod
+    def batchPressure(volume, compliance, compliance_curve):
+        if compliance_curve is None:
+            return volume / compliance
+        return compliance_curve.pressure(volume)
+
+    @classmethod
+    def batchTimes(cls, time_length, time_step):
+        return np.arange(int(cls.stepCount(time_length, time_step))) * time_step
+
+    @classmethod
+    def batchOutput(cls, config, time_length, time_step, out = None):
+        # out, when given, is filled in place, such as a view of a sweep's shared memory
+        times = cls.batchTimes(time_length, time_step)
+        shape = (len(config['peep']), len(times) + 1, len(cls.parameters))
+        if out is None:
+            output = np.full(shape, np.nan)
+        elif out.shape != shape:
+            raise ValueError("Batch output needs shape '{}', not '{}'".format(shape, out.shape))
+        else:
+            output = out
+            output[:] = np.nan
+        output[:, 0, :] = 0
+        output[:, 0, cls.parameters.pressure - 1] = config['peep']
+        output[:, 0, cls.parameters.p_alv - 1] = config['peep']
+        return times, output
+
+    @classmethod
+    def batchMusclePressure(cls, config, output, time_step):
+        # each step's muscle pressure for every configuration, zero without an effort; sampled and recorded
+        # a block of steps at a time. None when no configuration has an effort
+        efforts = config['effort']
+        has_effort = np.array([effort is not None for effort in efforts], dtype = bool)
+        if not has_effort.any():
+            return None
+
+        def blocks():
+            steps = output.shape[1] - 1
+            for start in range(0, steps, MuscleEffort.BLOCK_LENGTH):
+                count = min(MuscleEffort.BLOCK_LENGTH, steps - start)
+                block = MuscleEffort.batchSamples(efforts, start, count, time_step)
+                output[has_effort, start + 1:start + 1 + count, cls.parameters.p_mus - 1] = block[has_effort]
+                yield from block.T
+        return blocks()
+
+    @classmethod
+    def batchTable(cls, config, time_step):
+        # the mode's phase table over arrays of settings, one entry per configuration; a trigger no
+        # configuration sets is left out, as in the step loop
+        ventilator = cls(Patient())
+        ventilator.patient.resistance = config['resistance']
+        resolved = dict(config)
+        for key in ('trigger_flow', 'trigger_pressure'):
+            if np.isnan(config[key]).all():
+                resolved[key] = None
+        return ventilator.phaseLaws(RunConfiguration(resolved), time_step)
+
+    @classmethod
+    def simulate_batch(cls, time_length = 60, time_step = 0.02, resistance = None, compliance = None,
+                       compliance_curve = None, effort = None, out = None, **settings):
+        # the step loop of phaseMachine over many configurations at once, driven by the same phase table, so
+        # each configuration's rows match a scalar simulate() of it exactly
+        config = cls.batchSettings(resistance, compliance, settings, effort)
+        times, output = cls.batchOutput(config, time_length, time_step, out)
+        laws = cls.batchTable(config, time_step)
+
+        compliance = config['compliance']
+        count = len(config['peep'])
+        configs = np.arange(count)
+        inspiratory = cls.phase.inspiratory
+        # (phase value, law, next phase values) for each row of the table
+        table = [(phase.value, law, np.broadcast_to(getattr(law.next_phase, 'value', law.next_phase), count))
+                 for phase, law in laws.items()]
+
+        phase = np.full(count, inspiratory.value)
+        volume = cls.batchVolume(config['peep'], compliance, compliance_curve)
+        current_volume = np.zeros(count)
+        peak_flow = np.zeros(count)
+        phase_start = np.zeros(count)
+        breath_start = np.zeros(count)
+        flow_cursor = np.zeros(count, dtype = int)
+
+        muscle_pressure = cls.batchMusclePressure(config, output, time_step)
+        p_mus = 0
+        for step, current_time in enumerate(times):
+            if muscle_pressure is not None:
+                p_mus = next(muscle_pressure)
+            masks = [phase == value for value, law, next_phase in table]
+            inspiring = phase == inspiratory.value
+            elapsed = current_time - phase_start * time_step
+
+            p_alv = cls.batchPressure(volume, compliance, compliance_curve) - p_mus
+            current_flow = np.zeros(count)
+            for mask, (value, law, next_phase) in zip(masks, table):
+                if law.flow_samples is None:
+                    current_flow = np.where(mask, law.flow(elapsed, p_alv), current_flow)
+                else:
+                    current_flow = np.where(mask, law.flow_samples[configs, flow_cursor], current_flow)
+                    flow_cursor = np.where(mask, np.minimum(flow_cursor + 1, law.flow_samples.shape[1] - 1), flow_cursor)
+            delta_volume = current_flow * time_step
+            volume = volume + delta_volume
+            current_volume = current_volume + delta_volume
+            p_alv = cls.batchPressure(volume, compliance, compliance_curve) - p_mus
+            peak_flow = np.where(inspiring & (current_flow > peak_flow), current_flow, peak_flow)
+
+            pressure = np.zeros(count)
+            for mask, (value, law, next_phase) in zip(masks, table):
+                pressure = np.where(mask, law.pressure(current_flow, p_alv), pressure)
+            row = output[:, step + 1, :]
+            row[:, cls.parameters.time - 1] = current_time
+            row[:, cls.parameters.flow - 1] = current_flow
+            row[:, cls.parameters.volume - 1] = current_volume
+            row[:, cls.parameters.pressure - 1] = pressure
+            row[:, cls.parameters.p_alv - 1] = p_alv
+            if cls.records_peak_flow:
+                row[:, cls.parameters.peak_flow - 1] = np.where(inspiring, peak_flow, np.nan)
+
+            next_step = step + 1
+            new_phase = phase
+            for mask, (value, law, next_phase) in zip(masks, table):
+                end = law.end(phase_start, breath_start)
+                if end is None:
+                    cycled = law.cycle(next_step * time_step, phase_start * time_step, breath_start * time_step,
+                                       current_volume, current_flow, peak_flow) > 0
+                else:
+                    cycled = next_step >= end
+                if law.trigger is not None:
+                    cycled = cycled | (law.trigger(current_flow, p_alv) > 0)
+                new_phase = np.where(mask & cycled, next_phase, new_phase)
+
+            changed = new_phase != phase
+            phase = new_phase
+            phase_start[changed] = next_step
+            flow_cursor[changed] = 0
+            new_breath = changed & (phase == inspiratory.value)
+            current_volume[new_breath] = 0
+            peak_flow[new_breath] = 0
+            breath_start[new_breath] = next_step
+
+        return output
+
+    def tick(self, phase = None):
+        self.current_phase = phase
+        if self.recording == 'summary':
+            if self.trace.length == self.trace.capacity:
+                self.flushSummary()
+            cursor = self.trace.append()
+            self.trace_phases[cursor] = phase.value
+            return cursor
+
+        return self.trace.append()
+
+    def flushSummary(self):
+        self.summary.addBlock(self.trace.columns[:, :self.trace.length], self.trace_phases[:self.trace.length])
+        self.trace.columns[:] = np.nan
+        self.trace.length = 0
     
     def record(self, values):
+        cursor = self.trace.cursor
         for key in values:
-            self.output[0, self.parameters[key] - 1] = values[key]
+            self.trace.columns[self.parameters[key] - 1, cursor] = values[key]
+
+    def blockColumns(self, count):
+        # a block of rows computed in place: the trace's own rows, or a scratch block for the summary
+        if self.recording == 'summary':
+            return np.full((len(self.parameters), count), np.nan)
+        return self.trace.columns[:, self.trace.extend(count)]
+
+    def recordColumns(self, columns, phases):
+        if self.recording == 'summary':
+            self.flushSummary()
+            self.summary.addBlock(columns, phases)
+
+    def recordBlock(self, values, phases):
+        columns = self.blockColumns(len(phases))
+        for key in values:
+            columns[self.parameters[key] - 1] = values[key]
+        self.recordColumns(columns, phases)
             
     def data(self, key):
-        return np.flip(self.output[:, self.parameters[key] - 1])
+        return self.trace.column(self.parameters[key] - 1)
+
+    def breaths(self, key):
+        if self.summary is None:
+            raise ValueError("Breath metrics need a run recorded with record = 'summary'")
+        self.flushSummary()
+        return self.summary.table()[:, self.breath_metrics[key] - 1]
     
-    def plot(self, keys, axis = None, scalefactor = 1, zeroline = True):
+    def plot(self, keys, axis = None, scalefactor = 1, zeroline = True, decimate = None):
         if isinstance(keys, str):
             keys = [keys]
             
         if axis is None:
             axis = plt.gca()
     
+        decimator = None if decimate is None else Decimator.forAxis(axis, decimate)
         for key in keys:
-            axis.plot(self.data('time'), self.data(key) * scalefactor, label = key)
+            if decimator is None:
+                axis.plot(self.data('time'), self.data(key) * scalefactor, label = key)
+            else:
+                decimator.plot(self.data('time'), self.data(key) * scalefactor, label = key)
         axis.legend()
         
         if zeroline:
             axis.axhline(0, color = 'black')
-        return axis
\ No newline at end of file
+        return axis
+
+    def waveformFigure(self):
+        if self.waveform_figure is None:
+            self.waveform_figure = WaveformFigure(12, self.volume_limits)
+        return self.waveform_figure
+
+    def interactWith(self, ui, controls):
+        import ipywidgets as widgets
+        import IPython.display
+
+        figure = self.waveformFigure()
+        output = widgets.Output()
+
+        def update(change = None):
+            self.interactive_shim(**{key: control.value for key, control in controls.items()})
+            if not figure.blitting:
+                with output:
+                    output.clear_output(wait = True)
+                    IPython.display.display(figure.figure)
+
+        for control in controls.values():
+            if isinstance(control, widgets.Widget):
+                control.observe(update, names = 'value')
+
+        if figure.blitting:
+            with output:
+                IPython.display.display(figure.figure.canvas)
+        update()
+
+        return IPython.display.display(ui, output)
@@ -1,92 +1,52 @@
 import numpy as np
-import matplotlib.pyplot as plt
 from VentSimulator.Ventilator import Ventilator
+from VentSimulator.FlowProfile import FlowProfile
+from VentSimulator.PhaseLaw import PhaseLaw
 
 class VolumeVentilator(Ventilator):
     from enum import Enum
-    flow_patterns = Enum('flowPatterns', ['square', 'decelerating'])
+    flow_patterns = Enum('flowPatterns', ['square', 'decelerating', 'sinusoidal'],
+                         module = __name__, qualname = 'VolumeVentilator.flow_patterns')
     mode_defaults = {Ventilator.settings.flow: 1, 
                      Ventilator.settings.volume_target: 0.5, 
                      Ventilator.settings.flow_pattern: flow_patterns.square}
+    volume_limits = (0, 2000)
     
     def __init__(self, patient = None):
         super().__init__(patient)
-        
-    def setupInspiratoryFlow(self, time_step):        
-        if self['flow_pattern'] == self.flow_patterns.decelerating:
-            rise_time_steps = int(np.ceil(self['rise_time'] / time_step))
-            rise_time_flow = np.linspace(0, 2, num = rise_time_steps) * self['flow']
-            rise_time_volume = np.sum(rise_time_flow * time_step)
-        
-            planned_inspiratory_time = (self['volume_target'] - rise_time_volume) / self['flow']
-            total_time_steps = int(np.ceil(planned_inspiratory_time / time_step))
-            
-            return np.append(rise_time_flow, np.linspace(2, 0, num = total_time_steps) * self['flow'])
-        
-        rise_time_steps = int(np.ceil(self['rise_time'] / time_step))
-        rise_time_flow = np.linspace(0, 1, num = rise_time_steps) * self['flow']
-        return np.append(rise_time_flow, self['flow'])
-        
-    def simulate(self, time_length = 60, time_step = 0.02):
-        super().simulate(time_length, time_step)
 
-        phase = self.phase.inspiratory
-        current_time = 0
-        current_volume = 0
-        last_breath_start = 0
-        last_pause_start = 0
+    @classmethod
+    def inspiratoryFlow(cls, flow_pattern, flow, volume_target, rise_time, time_step):
+        return FlowProfile.resolve(flow_pattern).compiled(flow, volume_target, rise_time, time_step)
         
-        flow = self.setupInspiratoryFlow(time_step)
+    def phaseLaws(self, config, time_step):
+        laws = super().phaseLaws(config, time_step)
+        flow_pattern, flow, volume_target, rise_time = config.flow_pattern, config.flow, config.volume_target, config.rise_time
+        laws[self.phase.inspiratory] = PhaseLaw(
+            lambda elapsed, p_alv: np.broadcast_to(
+                FlowProfile.resolve(flow_pattern).flowAt(elapsed, flow, volume_target, rise_time), np.shape(p_alv)),
+            lambda flow, p_alv: flow * self.patient.resistance + p_alv,
+            lambda time, phase_start, breath_start, breath_volume, flow, peak_flow:
+                self.CLOSE_ENOUGH - (volume_target - breath_volume),
+            self.afterInspiration(config),
+            None if time_step is None else self.flowSamples(config, time_step))
+        return laws
+
+    @classmethod
+    def flowSamples(cls, config, time_step):
+        # compiled once per settings change; the step loop reads it with an integer cursor. A batch table
+        # holds one row per configuration, padded with its last sample
+        if np.ndim(config.flow) == 0:
+            return cls.inspiratoryFlow(config.flow_pattern, config.flow, config.volume_target, config.rise_time,
+                                       time_step).tolist()
+        profiles = [cls.inspiratoryFlow(*values, time_step) for values in
+                    zip(config.flow_pattern, config.flow, config.volume_target, config.rise_time)]
+        samples = np.empty((len(profiles), max(len(profile) for profile in profiles)))
+        for index, profile in enumerate(profiles):
+            samples[index, :len(profile)] = profile
+            samples[index, len(profile):] = profile[-1]
+        return samples
 
-        while current_time < time_length:
-            self.tick()
-            self.record({'time': current_time})
-
-            if phase == self.phase.inspiratory:
-                current_flow = flow[0]
-                if(len(flow) > 1):
-                    flow = flow[1:]
-                
-                delta_volume = current_flow * time_step
-                self.patient.addVolume(delta_volume)
-                current_volume = current_volume + delta_volume
-                
-                if (self['volume_target'] - current_volume) < self.CLOSE_ENOUGH:
-                    if self['inspiratory_pause'] > 0:
-                        phase = self.phase.inspiratory_pause
-                        last_pause_start = current_time
-                    else:
-                        phase = self.phase.expiratory
-                        
-                self.record({'flow': current_flow,
-                             'volume': current_volume,
-                             'pressure': current_flow * self.patient.resistance + self.patient.getPressure(),
-                             'p_alv': self.patient.getPressure()})
-            elif phase == self.phase.inspiratory_pause:
-                self.record({'flow': 0,
-                             'volume': current_volume,
-                             'pressure':self.patient.getPressure(),
-                             'p_alv': self.patient.getPressure()})
-                if current_time > last_pause_start + self['inspiratory_pause']:
-                    phase = self.phase.expiratory
-            else:
-                current_flow = -1 * ((self.patient.getPressure() - self['peep']) / self.patient.resistance)
-                delta_volume = current_flow * time_step
-                self.patient.addVolume(delta_volume)
-                current_volume = current_volume + delta_volume
-                
-                self.record({'flow': current_flow,
-                             'volume': current_volume,
-                             'pressure': self['peep'],
-                             'p_alv': self.patient.getPressure()}) 
-                
-                if self['respiratory_rate'] > 0 and (current_time - last_breath_start) > (60 / self['respiratory_rate']):
-                    phase = self.phase.inspiratory
-                    current_volume = 0
-                    last_breath_start = current_time
-                    flow = self.setupInspiratoryFlow(time_step)
-            current_time = current_time + time_step
-    
     def interactive_shim(self, volume_target, peep, flow, respiratory_rate, flow_pattern, 
         rise_time, inspiratory_pause, resistance, compliance):
         self['volume_target'] = volume_target
@@ -99,25 +59,19 @@ class VolumeVentilator(Ventilator):
         self.patient.resistance = resistance
         self.patient.compliance = compliance
 
-        self.simulate(12)
+        self.cachedSimulate(12)
 
-        f, (ax1,ax2,ax3) = plt.subplots(3,1,figsize=(12, 12))
-        ax1.set_ylim(0,50)
-        self.plot(['pressure', 'p_alv'], ax1)
-        self.plot('flow', ax2, scalefactor = 60)
-        ax2.set_ylim(-120, 120)
-        self.plot('volume', ax3, scalefactor = 1000)
+        self.waveformFigure().update(self)
 
     def interact(self):
         import ipywidgets as widgets
-        import IPython.display
 
         volume_target_widget = widgets.FloatSlider(
             value = self['volume_target'],
             min = 0.1,
             max = 2.0,
             step = 0.05,
-            continuous_update = False,
+            continuous_update = True,
             description = "Vt")
 
         peep_widget = widgets.IntSlider(
@@ -125,7 +79,7 @@ class VolumeVentilator(Ventilator):
             min = 0,
             max = 20,
             step = 1,
-            continuous_update = False,
+            continuous_update = True,
             description = "PEEP"
         )
 
@@ -134,7 +88,7 @@ class VolumeVentilator(Ventilator):
             min = 0,
             max = 2,
             step = 0.05,
-            continuous_update = False,
+            continuous_update = True,
             description = "Flow"
         )
         respiratory_rate_widget = widgets.IntSlider(
@@ -142,7 +96,7 @@ class VolumeVentilator(Ventilator):
             min = 0,
             max = 60,
             step = 1,
-            continuous_update = False,
+            continuous_update = True,
             description = "RR"
         )
 
@@ -157,7 +111,7 @@ class VolumeVentilator(Ventilator):
             min = 1, 
             max = 50,
             step = 1,
-            continuous_update = False,
+            continuous_update = True,
             description = "Resistance"
         )
 
@@ -167,7 +121,7 @@ class VolumeVentilator(Ventilator):
             max = -1,
             base = 10, 
             step = 0.01,
-            continuous_update = False,
+            continuous_update = True,
             description = "Compliance"
         )
 
@@ -175,7 +129,7 @@ class VolumeVentilator(Ventilator):
         patient_ui = widgets.VBox([resistance_widget, compliance_widget])
         ui = widgets.HBox([vent_ui, patient_ui])
 
-        output = widgets.interactive_output(self.interactive_shim, 
+        return self.interactWith(ui,
         {'volume_target': volume_target_widget,
             'peep': peep_widget,
             'flow': flow_widget,
@@ -184,6 +138,4 @@ class VolumeVentilator(Ventilator):
             'inspiratory_pause': widgets.fixed(0),
             'flow_pattern': flow_pattern_widget,
             'resistance': resistance_widget,
-            'compliance': compliance_widget})
-
-        return IPython.display.display(ui, output)
\ No newline at end of file
+            'compliance': compliance_widget})
\ No newline at end of file
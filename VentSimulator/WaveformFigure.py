@@ -0,0 +1,64 @@
+import matplotlib
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_webagg_core import FigureCanvasWebAggCore
+from VentSimulator.Decimator import Decimator
+
+class WaveformFigure:
+    traces = [('pressure', 0, 1), ('p_alv', 0, 1), ('flow', 1, 60), ('volume', 2, 1000)]
+
+    def __init__(self, time_length = 12, volume_limits = (0, 1000), figsize = (12, 12)):
+        with plt.ioff():
+            self.figure, self.axes = plt.subplots(3, 1, figsize = figsize)
+
+        for axis, limits in zip(self.axes, [(0, 50), (-120, 120), volume_limits]):
+            axis.set_xlim(0, time_length)
+            axis.set_ylim(*limits)
+            axis.axhline(0, color = 'black')
+
+        self.lines = {}
+        for key, axis_index, scalefactor in self.traces:
+            self.lines[key] = self.axes[axis_index].plot([], [], label = key, animated = self.blitting)[0]
+        for axis in self.axes:
+            axis.legend()
+
+        self.background = None
+        self.figure.canvas.mpl_connect('draw_event', self.onDraw)
+
+    @property
+    def blitting(self):
+        # ipympl's and WebAgg's canvases do not claim blitting, but they render into an Agg buffer and send the
+        # clients only the pixels that changed, so restoring the background and redrawing the lines into that
+        # buffer is their fast path too
+        canvas = self.figure.canvas
+        if isinstance(canvas, FigureCanvasWebAggCore):
+            return True
+        backend = matplotlib.get_backend().lower()
+        return canvas.supports_blit and 'inline' not in backend and backend != 'agg'
+
+    def onDraw(self, event):
+        if not self.blitting:
+            return
+
+        self.background = self.figure.canvas.copy_from_bbox(self.figure.bbox)
+        self.drawLines()
+
+    def drawLines(self):
+        for key, axis_index, scalefactor in self.traces:
+            self.axes[axis_index].draw_artist(self.lines[key])
+
+    def update(self, ventilator):
+        # a long trace is decimated to what the axis can show, so a redraw costs the same however long the run
+        time = ventilator.data('time')
+        for key, axis_index, scalefactor in self.traces:
+            decimator = Decimator.forAxis(self.axes[axis_index])
+            self.lines[key].set_data(*decimator.decimate(time, ventilator.data(key) * scalefactor, 0, len(time)))
+
+        canvas = self.figure.canvas
+        if self.background is None:
+            canvas.draw_idle()
+            return
+
+        canvas.restore_region(self.background)
+        self.drawLines()
+        canvas.blit(self.figure.bbox)
+        canvas.flush_events()
@@ -0,0 +1,54 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from VentSimulator.Scenario import Scenario
+
+def runScenario(task):
+    scenario, output_directory, dtype = task
+    try:
+        return scenario.run(output_directory, dtype)
+    except Exception as error:
+        return {'name': scenario.name, 'mode': scenario.mode, 'error': '{}: {}'.format(type(error).__name__, error)}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog = 'python -m VentSimulator',
+                                     description = 'Run ventilator scenarios from JSON or YAML files without a notebook.')
+    parser.add_argument('scenarios', nargs = '+', help = 'scenario files')
+    parser.add_argument('--output-dir', default = 'results')
+    parser.add_argument('--processes', type = int, default = None, help = 'worker processes (default: one per core)')
+    parser.add_argument('--dtype', default = 'float64', choices = ['float32', 'float64'], help = 'trace file precision')
+    parser.add_argument('--only', nargs = '+', default = None, help = 'run only the named scenarios')
+    args = parser.parse_args()
+
+    try:
+        scenarios = [scenario for path in args.scenarios for scenario in Scenario.load(path)]
+    except (OSError, ValueError) as error:
+        sys.exit(str(error))
+    if args.only is not None:
+        scenarios = [scenario for scenario in scenarios if scenario.name in args.only]
+    names = [scenario.name for scenario in scenarios]
+    if len(set(names)) != len(names):
+        sys.exit('Scenario names must be unique, since they name the output files')
+    os.makedirs(args.output_dir, exist_ok = True)
+
+    start = time.perf_counter()
+    failures = 0
+    steps = 0
+    tasks = [(scenario, args.output_dir, args.dtype) for scenario in scenarios]
+    with multiprocessing.Pool(args.processes) as pool:
+        for result in pool.imap_unordered(runScenario, tasks):
+            if 'error' in result:
+                failures = failures + 1
+                print('{:<32}{:<28}FAILED {}'.format(result['name'], result['mode'], result['error']), flush = True)
+                continue
+            steps = steps + result['steps']
+            print('{:<32}{:<28}{:>10} steps{:>9.3f} s{:>12.0f} steps/s{:>10.1f} MiB  {}'.format(
+                result['name'], result['mode'], result['steps'], result['wall_time'],
+                result['steps'] / result['wall_time'], result['bytes'] / 2**20, result['path']), flush = True)
+
+    wall_time = time.perf_counter() - start
+    print('{} scenarios ({} failed) in {:.2f} s: {:.2f} scenarios/s, {:.0f} steps/s overall'.format(
+        len(scenarios), failures, wall_time, len(scenarios) / wall_time, steps / wall_time))
+    sys.exit(1 if failures > 0 else 0)
@@ -0,0 +1,146 @@
+import argparse
+import asyncio
+import base64
+import json
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+
+# the repository root, where the VentSimulator package sits beside benchmarks
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if __package__ in (None, ''):
+    # run as python benchmarks/loadtest.py rather than python -m benchmarks.loadtest
+    sys.path.insert(0, ROOT)
+
+from VentSimulator.SimulationServer import encodeFrame, readFrame, TEXT, BINARY, CLOSE
+
+MODES = ['VolumeVentilator', 'PressureVentilator', 'PressureSupportVentilator']
+
+def simulationRequests(count, time_length, time_step, seed):
+    # distinct requests across modes, settings and patients
+    rng = np.random.default_rng(seed)
+    requests = []
+    for index in range(count):
+        requests.append({'mode': MODES[index % len(MODES)],
+                         'settings': {'peep': int(rng.choice([0, 5, 10])), 'respiratory_rate': int(rng.choice([10, 15, 20]))},
+                         'patient': {'resistance': round(float(rng.uniform(5, 30)), 1),
+                                     'compliance': round(float(rng.uniform(0.02, 0.1)), 3)},
+                         'time_length': time_length, 'time_step': time_step})
+    return requests
+
+async def readResponse(reader):
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return status, headers, await reader.readexactly(int(headers.get('content-length', 0)))
+
+async def httpClient(host, port, requests, latencies, counts):
+    reader, writer = await asyncio.open_connection(host, port)
+    for request in requests:
+        body = json.dumps(request).encode()
+        start = time.perf_counter()
+        writer.write('POST /simulate HTTP/1.1\r\nHost: {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n\r\n'
+                     .format(host, len(body)).encode() + body)
+        await writer.drain()
+        status, headers, payload = await readResponse(reader)
+        latencies.append(time.perf_counter() - start)
+        counts['bytes'] = counts['bytes'] + len(payload)
+        counts['errors'] = counts['errors'] + (status != 200)
+    writer.close()
+
+async def websocketClient(host, port, requests, latencies, counts):
+    reader, writer = await asyncio.open_connection(host, port)
+    key = base64.b64encode(os.urandom(16)).decode()
+    writer.write('GET /ws HTTP/1.1\r\nHost: {}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\nSec-WebSocket-Key: {}\r\n'
+                 'Sec-WebSocket-Version: 13\r\n\r\n'.format(host, key).encode())
+    await writer.drain()
+    status, headers, payload = await readResponse(reader)
+    if status != 101:
+        raise ConnectionError('WebSocket upgrade refused with status {}'.format(status))
+
+    for index, request in enumerate(requests):
+        start = time.perf_counter()
+        writer.write(encodeFrame(TEXT, json.dumps(dict(request, id = index)).encode(), os.urandom(4)))
+        await writer.drain()
+        while True:
+            opcode, payload = await readFrame(reader, 2**31)
+            if opcode == BINARY:
+                counts['bytes'] = counts['bytes'] + len(payload)
+                continue
+            message = json.loads(payload)
+            if 'error' in message:
+                counts['errors'] = counts['errors'] + 1
+                break
+            if message.get('done'):
+                break
+        latencies.append(time.perf_counter() - start)
+
+    writer.write(encodeFrame(CLOSE, b'\x03\xe8', os.urandom(4)))
+    await writer.drain()
+    writer.close()
+
+async def serverStats(host, port):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write('GET /stats HTTP/1.1\r\nHost: {}\r\nConnection: close\r\n\r\n'.format(host).encode())
+    await writer.drain()
+    status, headers, payload = await readResponse(reader)
+    writer.close()
+    return json.loads(payload)
+
+async def loadTest(args):
+    distinct = simulationRequests(args.distinct, args.time_length, args.time_step, args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    picks = rng.integers(len(distinct), size = args.requests)
+    client = websocketClient if args.protocol == 'ws' else httpClient
+    latencies = []
+    counts = {'bytes': 0, 'errors': 0}
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client(args.host, args.port, [distinct[pick] for pick in picks[index::args.clients]],
+                                  latencies, counts) for index in range(args.clients)])
+    wall_time = time.perf_counter() - start
+
+    latencies = np.array(latencies) * 1000
+    print('{} requests ({} distinct) over {} {} clients in {:.2f} s: {:.1f} requests/s, {:.1f} MiB received, {} errors'
+          .format(len(latencies), args.distinct, args.clients, args.protocol, wall_time, len(latencies) / wall_time,
+                  counts['bytes'] / 2**20, counts['errors']))
+    print('latency ms: p50 {:.1f}  p90 {:.1f}  p99 {:.1f}  max {:.1f}  mean {:.1f}'.format(
+        *np.percentile(latencies, [50, 90, 99]), latencies.max(), latencies.mean()))
+    print('server: {}'.format(json.dumps(await serverStats(args.host, args.port))))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog = 'python -m benchmarks.loadtest',
+                                     description = 'Load-test a running SimulationServer and report latency percentiles.')
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 8765)
+    parser.add_argument('--protocol', default = 'ws', choices = ['ws', 'http'])
+    parser.add_argument('--clients', type = int, default = 32, help = 'concurrent connections')
+    parser.add_argument('--requests', type = int, default = 500, help = 'requests across all clients')
+    parser.add_argument('--distinct', type = int, default = 50, help = 'distinct simulations among the requests')
+    parser.add_argument('--time-length', type = float, default = 60)
+    parser.add_argument('--time-step', type = float, default = 0.02)
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--spawn', action = 'store_true', help = 'start a local server for the run')
+    parser.add_argument('--processes', type = int, default = None, help = 'worker processes of a spawned server')
+    args = parser.parse_args()
+
+    server = None
+    if args.spawn:
+        command = [sys.executable, '-m', 'VentSimulator.SimulationServer', '--host', args.host, '--port', str(args.port)]
+        if args.processes is not None:
+            command = command + ['--processes', str(args.processes)]
+        server = subprocess.Popen(command, stdout = subprocess.PIPE, text = True, cwd = ROOT)
+        server.stdout.readline()
+    try:
+        asyncio.run(loadTest(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
@@ -0,0 +1,146 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import queue as queues
+import resource
+import sys
+import time
+import numpy as np
+
+if __package__ in (None, ''):
+    # run as python benchmarks/suite.py rather than python -m benchmarks.suite: the VentSimulator package sits
+    # beside benchmarks, not beside this file
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from VentSimulator.VolumeVentilator import VolumeVentilator
+from VentSimulator.PressureVentilator import PressureVentilator
+from VentSimulator.PressureSupportVentilator import PressureSupportVentilator
+
+MODES = {'volume_square': (VolumeVentilator, {'flow_pattern': VolumeVentilator.flow_patterns.square}),
+         'volume_decelerating': (VolumeVentilator, {'flow_pattern': VolumeVentilator.flow_patterns.decelerating}),
+         'pressure': (PressureVentilator, {}),
+         'pressure_support': (PressureSupportVentilator, {})}
+TIME_LENGTHS = [12, 60, 600, 3600]
+TIME_STEPS = [0.02, 0.005, 0.001, 0.0005]
+POLL_INTERVAL = 1
+
+def runCase(mode, method, time_length, time_step, record, fast_forward, queue):
+    ventilator_class, settings = MODES[mode]
+    ventilator = ventilator_class()
+    for key, value in settings.items():
+        ventilator[key] = value
+
+    baseline_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    ventilator.simulate(time_length, time_step, method = method, record = record, fast_forward = fast_forward)
+    wall_time = time.perf_counter() - start
+    peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_memory
+
+    queue.put({'wall_time': wall_time, 'peak_memory_kib': max(peak_memory, 0)})
+
+def collect(process, queue, timeout):
+    # the child's measurement, or None when it raised, died or ran past timeout; a child that fails puts
+    # nothing on the queue, so the queue is polled while the child is alive rather than waited on
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        try:
+            return queue.get(timeout = POLL_INTERVAL)
+        except queues.Empty:
+            if deadline is not None and time.monotonic() > deadline:
+                return None
+            if not process.is_alive():
+                # it may have finished between the poll and the check
+                try:
+                    return queue.get(timeout = POLL_INTERVAL)
+                except queues.Empty:
+                    return None
+
+def caseKey(result):
+    return (result['mode'], result['method'], result['record'], result.get('fast_forward', False),
+            result['time_length'], result['time_step'])
+
+def benchmark(modes, methods, time_lengths, time_steps, record, max_steps, fast_forward = False, timeout = None):
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for mode in modes:
+        for method in methods:
+            if method not in MODES[mode][0].methods:
+                continue
+            for time_length in time_lengths:
+                for time_step in time_steps:
+                    steps = int(MODES[mode][0].stepCount(time_length, time_step))
+                    if max_steps is not None and steps > max_steps:
+                        continue
+
+                    queue = context.Queue()
+                    process = context.Process(target = runCase,
+                                              args = (mode, method, time_length, time_step, record, fast_forward, queue))
+                    process.start()
+                    measurement = collect(process, queue, timeout)
+                    process.join(POLL_INTERVAL)
+                    if process.is_alive():
+                        process.terminate()
+                        process.join()
+
+                    result = {'mode': mode, 'method': method, 'record': record, 'fast_forward': fast_forward,
+                              'time_length': time_length, 'time_step': time_step, 'steps': steps}
+                    if measurement is None or process.exitcode != 0:
+                        result.update({'failed': True, 'exitcode': process.exitcode})
+                        results.append(result)
+                        print('{:<22}{:<10}{:>8}{:>9}{:>11}  FAILED (exit code {})'.format(
+                            mode, method, time_length, time_step, steps, process.exitcode), flush = True)
+                        continue
+
+                    result['steps_per_second'] = steps / measurement['wall_time']
+                    result.update(measurement)
+                    results.append(result)
+                    print('{:<22}{:<10}{:>8}{:>9}{:>11}{:>10.3f} s{:>12.0f} steps/s{:>10} KiB'.format(
+                        mode, method, time_length, time_step, steps, result['wall_time'],
+                        result['steps_per_second'], result['peak_memory_kib']), flush = True)
+    return results
+
+def compare(results, baseline, threshold):
+    reference = {caseKey(result): result for result in baseline['results']}
+    regressions = 0
+    for result in results:
+        if result.get('failed') or caseKey(result) not in reference or reference[caseKey(result)].get('failed'):
+            continue
+        ratio = result['wall_time'] / reference[caseKey(result)]['wall_time']
+        flag = 'REGRESSION' if ratio > threshold else ''
+        regressions = regressions + (ratio > threshold)
+        print('{:<22}{:<10}{:>8}{:>9}{:>8.2f}x {}'.format(result['mode'], result['method'], result['time_length'],
+                                                         result['time_step'], ratio, flag))
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog = 'python -m benchmarks.suite',
+                                     description = 'Time Ventilator.simulate() across modes, step sizes and run lengths.')
+    parser.add_argument('--output', default = 'benchmark_results.json')
+    parser.add_argument('--modes', nargs = '+', default = list(MODES), choices = list(MODES))
+    parser.add_argument('--methods', nargs = '+', default = ['euler'])
+    parser.add_argument('--time-lengths', nargs = '+', type = float, default = TIME_LENGTHS)
+    parser.add_argument('--time-steps', nargs = '+', type = float, default = TIME_STEPS)
+    parser.add_argument('--record', default = 'trace', choices = ['trace', 'summary'])
+    parser.add_argument('--fast-forward', action = 'store_true', help = 'tile converged breaths instead of integrating them')
+    parser.add_argument('--max-steps', type = int, default = None, help = 'skip cases with more steps than this')
+    parser.add_argument('--compare', default = None, help = 'earlier results file to check for regressions')
+    parser.add_argument('--threshold', type = float, default = 1.25, help = 'slowdown ratio reported as a regression')
+    parser.add_argument('--timeout', type = float, default = None, help = 'seconds after which a case counts as failed')
+    args = parser.parse_args()
+
+    results = benchmark(args.modes, args.methods, args.time_lengths, args.time_steps, args.record, args.max_steps,
+                        args.fast_forward, args.timeout)
+    with open(args.output, 'w') as output:
+        json.dump({'python': platform.python_version(),
+                   'numpy': np.__version__,
+                   'platform': platform.platform(),
+                   'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   'results': results}, output, indent = 2)
+
+    failures = sum(1 for result in results if result.get('failed'))
+    if args.compare is not None:
+        with open(args.compare) as baseline:
+            failures = failures + compare(results, json.load(baseline), args.threshold)
+    sys.exit(1 if failures > 0 else 0)
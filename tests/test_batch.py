@@ -0,0 +1,58 @@
+import itertools
+import unittest
+import numpy as np
+from VentSimulator.MuscleEffort import MuscleEffort
+from VentSimulator.VolumeVentilator import VolumeVentilator
+from VentSimulator.PressureVentilator import PressureVentilator
+from VentSimulator.PressureSupportVentilator import PressureSupportVentilator
+
+class BatchTest(unittest.TestCase):
+    # simulate_batch walks the same phase table as simulate(), so each configuration's rows match a scalar run
+    # of it bit for bit
+    cases = {VolumeVentilator: {'flow_pattern': list(VolumeVentilator.flow_patterns), 'inspiratory_pause': [0, 0.3]},
+             PressureVentilator: {'inspiratory_pause': [0, 0.2], 'peep': [0, 5]},
+             PressureSupportVentilator: {'flow_trigger': [0.1, 0.25], 'peep': [0, 5]}}
+    patients = {'resistance': [5, 20], 'compliance': [0.02, 0.08]}
+
+    def assertMatchesScalar(self, ventilator_class, output, configs, efforts = None):
+        for index, config in enumerate(configs):
+            ventilator = ventilator_class()
+            ventilator.patient.resistance = config['resistance']
+            ventilator.patient.compliance = config['compliance']
+            if efforts is not None:
+                ventilator.patient.setEffort(efforts[index])
+            for key, value in config.items():
+                if key not in ('resistance', 'compliance'):
+                    ventilator[key] = value
+            ventilator.simulate(12)
+            np.testing.assert_array_equal(output[index], ventilator.output, err_msg = str(config))
+
+    def testMatchesScalar(self):
+        for ventilator_class, settings in self.cases.items():
+            values = dict(self.patients, **settings)
+            configs = [dict(zip(values, combination)) for combination in itertools.product(*values.values())]
+            output = ventilator_class.simulate_batch(12, **{key: [config[key] for config in configs] for key in values})
+            self.assertMatchesScalar(ventilator_class, output, configs)
+
+    def testMatchesScalarWithTriggers(self):
+        efforts = [None, MuscleEffort(rate = 20, amplitude = 6)]
+        for ventilator_class in self.cases:
+            combinations = list(itertools.product(range(len(efforts)), [None, 0.05], [None, 2.0]))
+            configs = [{'resistance': 10, 'compliance': 0.05, 'trigger_flow': trigger_flow,
+                        'trigger_pressure': trigger_pressure, 'respiratory_rate': 10}
+                       for effort, trigger_flow, trigger_pressure in combinations]
+            output = ventilator_class.simulate_batch(12, effort = [efforts[effort] for effort, _, _ in combinations],
+                                                     **{key: [config[key] for config in configs] for key in configs[0]})
+            self.assertMatchesScalar(ventilator_class, output, configs,
+                                     [efforts[effort] for effort, _, _ in combinations])
+
+    def testFillsOut(self):
+        out = np.zeros((3, 601, len(PressureVentilator.parameters)))
+        output = PressureVentilator.simulate_batch(12, peep = [0, 5, 10], out = out)
+        self.assertIs(output, out)
+        np.testing.assert_array_equal(out, PressureVentilator.simulate_batch(12, peep = [0, 5, 10]))
+        with self.assertRaises(ValueError):
+            PressureVentilator.simulate_batch(12, peep = [0, 5], out = out)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import tracemalloc
+import unittest
+import warnings
+import numpy as np
+from VentSimulator.MultiCompartmentPatient import MultiCompartmentPatient
+from VentSimulator.VolumeVentilator import VolumeVentilator
+from VentSimulator.PressureVentilator import PressureVentilator
+from VentSimulator.PressureSupportVentilator import PressureSupportVentilator
+
+modes = [VolumeVentilator, PressureVentilator, PressureSupportVentilator]
+
+class EmptyRunTest(unittest.TestCase):
+    def testEveryMethod(self):
+        for ventilator_class in modes:
+            for method in ventilator_class.methods:
+                ventilator = ventilator_class()
+                ventilator.simulate(0, method = method)
+                self.assertEqual(ventilator.output.shape, (1, len(ventilator.parameters)), method)
+
+                ventilator = ventilator_class()
+                ventilator.simulate(0, method = method, record = 'summary')
+                self.assertEqual(len(ventilator.summary.table()), 0, method)
+
+class AnalyticTest(unittest.TestCase):
+    def testMatchesFineEuler(self):
+        for ventilator_class in (PressureVentilator, PressureSupportVentilator):
+            analytic = ventilator_class()
+            analytic.simulate(12, 0.001, method = 'analytic')
+            euler = ventilator_class()
+            euler.simulate(12, 0.001)
+            np.testing.assert_allclose(analytic.data('p_alv'), euler.data('p_alv'), atol = 0.05)
+
+    def testWithoutFlowTrigger(self):
+        ventilator = PressureSupportVentilator()
+        ventilator['flow_trigger'] = 0
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            ventilator.simulate(12, method = 'analytic')
+        self.assertTrue(np.all(np.isfinite(ventilator.data('p_alv'))))
+
+class FastForwardTest(unittest.TestCase):
+    def testMatchesFullRun(self):
+        cases = [(VolumeVentilator, {'inspiratory_pause': 0.5, 'flow_pattern': VolumeVentilator.flow_patterns.decelerating}),
+                 (PressureVentilator, {'inspiratory_pause': 0.3, 'respiratory_rate': 30}),
+                 (PressureSupportVentilator, {'respiratory_rate': 25})]
+        for ventilator_class, settings in cases:
+            for record in ventilator_class.record_modes:
+                runs = []
+                for fast_forward in (False, True):
+                    ventilator = ventilator_class()
+                    for key, value in settings.items():
+                        ventilator[key] = value
+                    ventilator.simulate(300, record = record, fast_forward = fast_forward)
+                    runs.append(ventilator.output if record == 'trace' else ventilator.breaths('tidal_volume'))
+                self.assertGreater(ventilator.fast_forward.tiled_breaths, 0)
+                self.assertEqual(runs[0].shape, runs[1].shape)
+                np.testing.assert_allclose(runs[1], runs[0], rtol = 0, atol = 1e-6)
+
+class SummaryTest(unittest.TestCase):
+    def peakMemory(self, ventilator, method):
+        tracemalloc.start()
+        try:
+            ventilator.simulate(600, 0.001, method = method, record = 'summary')
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def testMemoryIsBounded(self):
+        # a trace of the same run would take 600000 rows of 7 columns, about 34 MB
+        for method in ('euler', 'analytic', 'rk45'):
+            self.assertLess(self.peakMemory(PressureVentilator(), method), 4 * 2**20, method)
+
+    def testTraceNeedsTraceRecording(self):
+        ventilator = PressureVentilator()
+        ventilator.simulate(12, record = 'summary')
+        with self.assertRaises(ValueError):
+            ventilator.saveTrace('unused.vtr')
+
+class CacheTest(unittest.TestCase):
+    def testHitRestoresTimeStep(self):
+        PressureVentilator().cachedSimulate(12, 0.01)
+        ventilator = PressureVentilator()
+        ventilator.simulate(3, 0.05)
+        ventilator.cachedSimulate(12, 0.01)
+        self.assertEqual(ventilator.time_step, 0.01)
+        self.assertEqual(len(ventilator.output), 1201)
+
+class MultiCompartmentTest(unittest.TestCase):
+    def testExchangeIsExact(self):
+        pressures = []
+        for time_step in (0.01, 0.0005):
+            patient = MultiCompartmentPatient([1, 20, 7], [0.005, 0.05, 0.02])
+            patient.setTimeStep(time_step)
+            patient.volumes = np.array([0.1, 0, 0.05])
+            for step in range(int(round(0.1 / time_step))):
+                patient.addVolume(0)
+            self.assertAlmostEqual(patient.volume, 0.15)
+            pressures.append(patient.getCompartmentPressures())
+        np.testing.assert_allclose(pressures[0], pressures[1], rtol = 1e-9)
+
+    def testStabilityLimit(self):
+        ventilator = PressureVentilator(MultiCompartmentPatient([1, 20], [0.005, 0.05]))
+        with self.assertRaises(ValueError):
+            ventilator.simulate(12, 0.02)
+        ventilator.simulate(12, 0.001)
+        self.assertLess(np.nanmax(ventilator.data('p_alv')), 25)
+
+if __name__ == '__main__':
+    unittest.main()